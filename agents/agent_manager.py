@@ -1,4 +1,13 @@
-from typing import Dict, Callable, Any
+from typing import Dict, Callable, Any, Iterable, Optional, Tuple, Union
+import asyncio
+import functools
+from concurrent.futures import Future
+
+from agents.backends import BACKENDS, INLINE, THREAD, ConcurrencyLimit, ExecutionBackends
+from agents.result_cache import ResultCache
+from tracing.tracer import tracer
+
+_MISSING = object()
 
 
 class DynamicAgent:
@@ -12,11 +21,41 @@ class DynamicAgent:
         description: str,
         input_type: str,
         functions: Dict[str, Callable[..., Any]],
+        tags: Iterable[str] = (),
+        backends: Optional[Dict[str, str]] = None,
+        max_concurrency: Optional[int] = None,
+        cacheable: Union[Iterable[str], Dict[str, Optional[float]]] = (),
     ):
         self.name = name
         self.description = description
         self.functions = functions
         self.input_type = input_type
+        self.tags = frozenset(tags)
+        # Execution backend per function name; see agents.backends
+        self.backends = backends or {}
+        for backend in self.backends.values():
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown execution backend {backend} for {name}")
+        # Most calls of this agent's functions running at once on the async path
+        self.max_concurrency = max_concurrency
+        # Deterministic functions whose results AgentManager may cache, mapped
+        # to their ttl in seconds (None for the cache's default)
+        if not isinstance(cacheable, dict):
+            cacheable = dict.fromkeys(cacheable)
+        self.cacheable: Dict[str, Optional[float]] = cacheable
+
+    def generate_prompt(self) -> str:
+        """
+        Generate this agent's section of the capability prompt
+        :return:
+        """
+        lines = [
+            f"- {self.name}: {self.description} with the following capabilities:\n. "
+            f"It requires that the input looks like this: "
+            f"{self.input_type}\n"
+        ]
+        lines.extend(f"  - {function_name}\n" for function_name in self.functions)
+        return "".join(lines)
 
     def execute_function(self, function_name: str, input_data=None, *args, **kwargs):
         """
@@ -40,20 +79,104 @@ class AgentManager:
     Agent Manager class to manage multiple agents
     """
 
-    def __init__(self, expected_input_type: str = "JSON"):
+    def __init__(
+        self,
+        expected_input_type: str = "JSON",
+        backends: Optional[ExecutionBackends] = None,
+        default_backend: str = THREAD,
+        result_cache: Optional[ResultCache] = None,
+    ):
         """
         Initialize the agent manager
+        :param expected_input_type:
+        :param backends: pools that agent functions run on
+        :param default_backend: backend for functions that do not declare one,
+            used by execute_function_async and submit_function
+        :param result_cache: memoizes the functions agents declare cacheable
         """
         self.agents: Dict[str, DynamicAgent] = {}
         self.expected_input_type = expected_input_type
+        self.backends = backends or ExecutionBackends()
+        self.default_backend = default_backend
+        self.result_cache = result_cache
+        self._limits: Dict[str, ConcurrencyLimit] = {}
+        self.version = 0  # Bumped on every registry change
+        self.dispatch: Dict[Tuple[str, str], DynamicAgent] = {}
+        self._agent_prompts: Dict[str, str] = {}
+        self._prompts: Dict[Tuple[Optional[frozenset], Optional[frozenset]], str] = {}
 
     def register_agent(self, agent: DynamicAgent):
         """
-        Register an agent
+        Register an agent, replacing any agent with the same name. Register it
+        again after changing its functions so cached prompts are rebuilt
         :param agent:
         :return:
         """
+        if agent.name in self.agents:
+            self._forget(agent.name)
         self.agents[agent.name] = agent
+        for function_name in agent.functions:
+            self.dispatch[(agent.name, function_name)] = agent
+        self._changed()
+
+    def unregister_agent(self, agent_name: str) -> bool:
+        """
+        Unregister an agent
+        :param agent_name:
+        :return: whether the agent was registered
+        """
+        if agent_name not in self.agents:
+            return False
+        self._forget(agent_name)
+        del self.agents[agent_name]
+        self._changed()
+        return True
+
+    def _changed(self):
+        self.version += 1
+        self._prompts.clear()
+
+    def _forget(self, agent_name: str):
+        for function_name in self.agents[agent_name].functions:
+            self.dispatch.pop((agent_name, function_name), None)
+        self._agent_prompts.pop(agent_name, None)
+        self.invalidate(agent_name)
+
+    def invalidate(self, agent_name: str, function_name: Optional[str] = None):
+        """
+        Drop cached results of an agent's functions, e.g. after the data a
+        lookup reads has changed
+        :param agent_name:
+        :param function_name: only this function, rather than all of them
+        :return:
+        """
+        agent = self.agents.get(agent_name)
+        if self.result_cache is None or agent is None:
+            return
+        for name in [function_name] if function_name else agent.cacheable:
+            self.result_cache.invalidate(agent_name, name)
+
+    def _cache_lookup(self, agent: DynamicAgent, function_name: str, input_data, args, kwargs):
+        # (key, cached result), with a None key for calls that are not cached
+        function = agent.functions.get(function_name)
+        if (
+            self.result_cache is None
+            or function is None
+            or function_name not in agent.cacheable
+        ):
+            return None, _MISSING
+        key = self.result_cache.key(
+            agent.name, function_name, function, input_data, args, kwargs
+        )
+        cached = self.result_cache.get(agent.name, function_name, key, _MISSING)
+        if isinstance(cached, dict):
+            cached = {**cached, "cached": True}
+        return key, cached
+
+    def _cache_store(self, agent: DynamicAgent, function_name: str, key: str, result):
+        self.result_cache.set(
+            agent.name, function_name, key, result, agent.cacheable[function_name]
+        )
 
     def execute_function(
         self, agent_name: str, function_name: str, input_data=None, *args, **kwargs
@@ -67,31 +190,222 @@ class AgentManager:
         :param kwargs:
         :return:
         """
-        agent = self.agents.get(agent_name)
-        if agent is not None:
-            return agent.execute_function(
+        agent = self.dispatch.get((agent_name, function_name)) or self.agents.get(
+            agent_name
+        )
+        if agent is None:
+            return {"error": f"Agent {agent_name} not found"}
+
+        key, cached = self._cache_lookup(agent, function_name, input_data, args, kwargs)
+        if cached is not _MISSING:
+            return cached
+        with tracer.span("agent.function", agent=agent_name, function=function_name):
+            result = agent.execute_function(
                 function_name, input_data, *args, **kwargs
             )  # Pass the optional input_data
-        return {"error": f"Agent {agent_name} not found"}
+        if key is not None:
+            self._cache_store(agent, function_name, key, result)
+        return result
+
+    def _resolve(self, agent_name: str, function_name: str):
+        agent = self.agents.get(agent_name)
+        if agent is None:
+            return None, None, {"error": f"Agent {agent_name} not found"}
+        function = agent.functions.get(function_name)
+        if function is None:
+            return agent, None, {
+                "error": f"Function {function_name} not found in {agent_name}"
+            }
+        return agent, function, None
+
+    def _limit_for(self, agent: DynamicAgent) -> Optional[ConcurrencyLimit]:
+        # Shared by submit_function and execute_function_async
+        if agent.max_concurrency is None:
+            return None
+        limit = self._limits.get(agent.name)
+        if limit is None or limit.limit != agent.max_concurrency:
+            limit = self._limits[agent.name] = ConcurrencyLimit(agent.max_concurrency)
+        return limit
+
+    def submit_function(
+        self, agent_name: str, function_name: str, input_data=None, *args, **kwargs
+    ) -> Future:
+        """
+        Start a function on its execution backend without waiting for it. Calls
+        over the agent's max_concurrency start as earlier ones finish. There is
+        no timeout here; bound the wait with future.result(timeout), the call
+        keeps its slot until it ends either way
+        :param agent_name:
+        :param function_name:
+        :param input_data:
+        :param args:
+        :param kwargs:
+        :return: a future for the function's result
+        """
+        agent, function, error = self._resolve(agent_name, function_name)
+        future = Future()
+        if error is not None:
+            future.set_result(error)
+            return future
+
+        key, cached = self._cache_lookup(agent, function_name, input_data, args, kwargs)
+        if cached is not _MISSING:
+            future.set_result(cached)
+            return future
+
+        executor = self.backends.executor_for(
+            agent.backends.get(function_name, self.default_backend)
+        )
+        limit = self._limit_for(agent)
+        if executor is not None and limit is None:
+            future = executor.submit(function, input_data, *args, **kwargs)
+        else:
 
-    def generate_prompt(self):
+            def start():
+                if not future.set_running_or_notify_cancel():
+                    if limit is not None:  # Cancelled while it waited
+                        limit.release()
+                    return
+                if executor is None:
+                    try:
+                        future.set_result(function(input_data, *args, **kwargs))
+                    except Exception as exc:
+                        future.set_exception(exc)
+                    finally:
+                        if limit is not None:
+                            limit.release()
+                    return
+                try:
+                    running = executor.submit(function, input_data, *args, **kwargs)
+                except Exception as exc:
+                    future.set_exception(exc)
+                    limit.release()
+                    return
+                running.add_done_callback(finish)
+
+            def finish(done: Future):
+                limit.release()
+                if done.exception() is None:
+                    future.set_result(done.result())
+                else:
+                    future.set_exception(done.exception())
+
+            if limit is None:
+                start()
+            else:
+                limit.acquire(start)
+        if key is not None:
+
+            def store(done: Future):
+                if not done.cancelled() and done.exception() is None:
+                    self._cache_store(agent, function_name, key, done.result())
+
+            future.add_done_callback(store)
+        return future
+
+    async def execute_function_async(
+        self,
+        agent_name: str,
+        function_name: str,
+        input_data=None,
+        *args,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ):
         """
-        Generate a prompt for the user
+        Execute a function on its execution backend without blocking the event loop
+        :param agent_name:
+        :param function_name:
+        :param input_data:
+        :param args:
+        :param timeout: seconds to wait before giving up on the result; not
+            supported by the inline backend, which runs on the event loop
+        :param kwargs:
         :return:
         """
-        prompt = "You have access to multiple specialized agents with unique functionalities:\n\n"
-        for agent_name, agent in self.agents.items():
-            prompt += (
-                f"- {agent_name}: {agent.description} with the following capabilities:\n. "
-                f"It requires that the input looks like this: "
-                f"{agent.input_type}\n"
+        agent, function, error = self._resolve(agent_name, function_name)
+        if error is not None:
+            return error
+
+        backend = agent.backends.get(function_name, self.default_backend)
+        if backend == INLINE and timeout is not None:
+            raise ValueError(
+                f"{agent_name}.{function_name} runs inline and cannot time out"
             )
-            for function_name in agent.functions.keys():
-                prompt += f"  - {function_name}\n"
-        prompt += (
+
+        key, cached = self._cache_lookup(agent, function_name, input_data, args, kwargs)
+        if cached is not _MISSING:
+            return cached
+
+        limit = self._limit_for(agent)
+        call = functools.partial(function, input_data, *args, **kwargs)
+        if limit is not None:
+            await limit.acquire_async()
+        future = None
+        try:
+            with tracer.span(
+                "agent.function",
+                agent=agent_name,
+                function=function_name,
+                backend=backend,
+            ):
+                if backend == INLINE:
+                    result = call()
+                else:
+                    loop = asyncio.get_running_loop()
+                    future = loop.run_in_executor(self.backends.executor_for(backend), call)
+                    if limit is not None:
+                        # A timed out call keeps running in the pool, so it keeps
+                        # its slot until it ends; only the wait is abandoned
+                        future.add_done_callback(lambda _: limit.release())
+                    result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return {"error": f"{agent_name}.{function_name} timed out after {timeout}s"}
+        finally:
+            if limit is not None and future is None:
+                limit.release()
+
+        if key is not None:
+            self._cache_store(agent, function_name, key, result)
+        return result
+
+    def generate_prompt(
+        self,
+        agent_names: Optional[Iterable[str]] = None,
+        tags: Optional[Iterable[str]] = None,
+    ):
+        """
+        Generate a prompt for the user, cached until the registry changes
+        :param agent_names: only describe these agents
+        :param tags: only describe agents with at least one of these tags
+        :return:
+        """
+        key = (
+            None if agent_names is None else frozenset(agent_names),
+            None if tags is None else frozenset(tags),
+        )
+        cached = self._prompts.get(key)
+        if cached is not None:
+            return cached
+
+        parts = [
+            "You have access to multiple specialized agents with unique functionalities:\n\n"
+        ]
+        for agent_name, agent in self.agents.items():
+            if key[0] is not None and agent_name not in key[0]:
+                continue
+            if key[1] is not None and not agent.tags & key[1]:
+                continue
+            agent_prompt = self._agent_prompts.get(agent_name)
+            if agent_prompt is None:
+                agent_prompt = self._agent_prompts[agent_name] = agent.generate_prompt()
+            parts.append(agent_prompt)
+        parts.append(
             "\nYou can instruct these agents to perform tasks for you. What would you like to do? "
             "Remember to return the answer in the following format: {'result': 'your answer', 'success': True}"
         )
+        prompt = "".join(parts)
+        self._prompts[key] = prompt
         return prompt
 
 
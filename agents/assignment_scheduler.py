@@ -0,0 +1,221 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import random
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from agents.async_manager import Assignment
+
+
+class ScheduledAssignment:
+    """
+    Scheduling state of one assignment inside an AssignmentScheduler
+    """
+
+    __slots__ = (
+        "assignment",
+        "interval",
+        "condition_check",
+        "action",
+        "due",
+        "in_flight",
+        "cancelled",
+        "checks",
+        "missed",
+        "errors",
+    )
+
+    def __init__(
+        self,
+        assignment: Assignment,
+        interval: float,
+        condition_check: Callable[..., bool],
+        action: Callable[..., Any],
+        due: float,
+    ):
+        self.assignment = assignment
+        self.interval = interval
+        self.condition_check = condition_check
+        self.action = action
+        self.due = due  # Next tick on the unjittered grid
+        self.in_flight = False
+        self.cancelled = False
+        self.checks = 0
+        self.missed = 0  # Ticks skipped because a check overran or the loop lagged
+        self.errors = 0
+
+
+class AssignmentScheduler:
+    """
+    Assignment Scheduler class to drive many assignments from one timer heap
+
+    A single coroutine sleeps until the next due tick, so idle assignments cost
+    a heap entry rather than a coroutine each. Checks are awaited through
+    AgentManager.execute_function_async, which keeps blocking agent functions
+    off the event loop, and at most max_in_flight of them run at once.
+    """
+
+    def __init__(self, max_in_flight: int = 100, jitter: float = 0.1):
+        """
+        :param max_in_flight: most checks running at the same time
+        :param jitter: fraction of the interval each tick may be delayed by,
+            so assignments added together do not fire together
+        """
+        self.max_in_flight = max_in_flight
+        self.jitter = jitter
+        self.entries: Dict[int, ScheduledAssignment] = {}
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _push(self, entry: ScheduledAssignment):
+        fire_at = entry.due + random.uniform(0, self.jitter * entry.interval)
+        heapq.heappush(self._heap, (fire_at, next(self._seq), entry))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def add(
+        self,
+        assignment: Assignment,
+        interval: float,
+        condition_check: Callable[..., bool],
+        action: Callable[..., Any],
+    ) -> ScheduledAssignment:
+        """
+        Schedule an assignment's check every interval seconds, from within the loop
+        :param assignment:
+        :param interval:
+        :param condition_check:
+        :param action: may be a coroutine function
+        :return:
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.cancel(assignment)
+        entry = ScheduledAssignment(
+            assignment, interval, condition_check, action, self._now()
+        )
+        assignment.running = True
+        self.entries[id(assignment)] = entry
+        self._push(entry)
+        return entry
+
+    def cancel(self, assignment: Assignment) -> bool:
+        """
+        Stop scheduling an assignment; a check already running is left to finish
+        :param assignment:
+        :return: whether the assignment was scheduled
+        """
+        entry = self.entries.pop(id(assignment), None)
+        if entry is None:
+            return False
+        entry.cancelled = True  # Its heap entry is skipped when it comes up
+        assignment.running = False
+        return True
+
+    def start(self):
+        """
+        Start the scheduler on the running event loop
+        :return:
+        """
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self, drain: bool = True):
+        """
+        Stop the scheduler
+        :param drain: wait for running checks to finish instead of cancelling them
+        :return:
+        """
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        if not drain:
+            for task in self._tasks:
+                task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - self._now()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = self._now()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, entry = heapq.heappop(self._heap)
+                if entry.cancelled:
+                    continue
+                if entry.in_flight:
+                    entry.missed += 1
+                else:
+                    entry.in_flight = True
+                    task = asyncio.ensure_future(self._check(entry))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+                # Skip ticks that already passed instead of firing them in a burst
+                entry.due += entry.interval
+                if entry.due <= now:
+                    skipped = int((now - entry.due) // entry.interval) + 1
+                    entry.missed += skipped
+                    entry.due += skipped * entry.interval
+                self._push(entry)
+
+    async def _check(self, entry: ScheduledAssignment):
+        assignment = entry.assignment
+        try:
+            async with self._semaphore:
+                if entry.cancelled:
+                    return
+                entry.checks += 1
+                result = await assignment.agent_manager.execute_function_async(
+                    assignment.agent_name,
+                    assignment.function_name,
+                    *assignment.args,
+                    **assignment.kwargs,
+                )
+                if entry.cancelled or not entry.condition_check(result):
+                    return
+                self.cancel(assignment)  # Stop this assignment
+                outcome = entry.action()
+                if inspect.isawaitable(outcome):
+                    await outcome
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            entry.errors += 1
+        finally:
+            entry.in_flight = False
+
+
+"""
+-- How to Use the AssignmentScheduler --
+async def main():
+    scheduler = AssignmentScheduler(max_in_flight=200)
+    scheduler.start()
+    for room in rooms:
+        assignment = Assignment(f"Monitor{room}", f"Monitor {room}", agent_manager, "SecurityAgent", "check_if_x_entered")
+        scheduler.add(assignment, 5, has_person_x_entered, person_x_entered_action)
+    ...
+    await scheduler.stop()
+"""
@@ -1,4 +1,4 @@
-from typing import Dict, Callable, Any
+from typing import Dict, Callable, Any, Optional
 import asyncio
 
 from agents.agent_manager import AgentManager, DynamicAgent
@@ -32,6 +32,7 @@ class Assignment:
         self.args = args
         self.kwargs = kwargs
         self.running = True
+        self._prompt = None
 
     async def start(
         self,
@@ -40,7 +41,8 @@ class Assignment:
         action: Callable[..., Any],
     ):
         while self.running:
-            result = self.agent_manager.execute_function(
+            # Runs on the function's execution backend so the loop is not blocked
+            result = await self.agent_manager.execute_function_async(
                 self.agent_name, self.function_name, *self.args, **self.kwargs
             )
             if condition_check(result):
@@ -48,7 +50,44 @@ class Assignment:
                 self.running = False  # Stop this assignment
             await asyncio.sleep(interval)
 
+    async def listen(
+        self,
+        source,
+        topic: str,
+        condition_check: Callable[..., bool],
+        action: Callable[..., Any],
+        fallback_interval: Optional[float] = None,
+        event_filter: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ):
+        """
+        Check the assignment only when a relevant event arrives
+        :param source: an EventBus or RedisEventSource
+        :param topic: topic, channel or pattern to subscribe to
+        :param condition_check:
+        :param action:
+        :param fallback_interval: also check after this many quiet seconds
+        :param event_filter: ignore events for which this returns False
+        :return:
+        """
+        subscription = await source.subscribe(topic)
+        try:
+            while self.running:
+                event = await subscription.get(fallback_interval)
+                if event is not None and event_filter and not event_filter(event):
+                    continue
+                result = await self.agent_manager.execute_function_async(
+                    self.agent_name, self.function_name, *self.args, **self.kwargs
+                )
+                if condition_check(result):
+                    action()
+                    self.running = False  # Stop this assignment
+        finally:
+            await subscription.close()
+
     def generate_async_prompt(self):
+        if self._prompt is not None:
+            return self._prompt
+
         prompt_parts = [
             f"You also have access to these special agents {self.agent_name} that can complete the assignment '{self.name}"
             f"' available:\n",
@@ -58,7 +97,8 @@ class Assignment:
             "What would you like to do?",
         ]
 
-        return "".join(prompt_parts)
+        self._prompt = "".join(prompt_parts)
+        return self._prompt
 
 
 # Condition check function
@@ -86,4 +126,9 @@ agent_manager.register_agent(DynamicAgent("SecurityAgent", "Monitors room entran
 assignment = Assignment("MonitorEntrance", "Monitor the room entrance for person X", agent_manager, "SecurityAgent", "check_if_x_entered")
 assignment.start(5, has_person_x_entered, person_x_entered_action)
 
+-- Or react to events instead of polling --
+bus = EventBus()
+asyncio.create_task(assignment.listen(bus, "room:entrance", has_person_x_entered, person_x_entered_action, fallback_interval=60))
+bus.publish("room:entrance", {"door": "open"})  # e.g. from inside an agent function
+
 """
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Deque, Optional
+
+# Run on the caller's thread (or event loop), for cheap functions
+INLINE = "inline"
+# Run on a shared thread pool, for blocking I/O
+THREAD = "thread"
+# Run on a shared process pool, for CPU-bound work. The function and its
+# arguments must be picklable, so it has to be defined at module level.
+PROCESS = "process"
+
+BACKENDS = (INLINE, THREAD, PROCESS)
+
+
+class ExecutionBackends:
+    """
+    Execution Backends class to own the pools agent functions run on
+
+    Pools are created on first use and shared by every agent of a manager.
+    """
+
+    def __init__(
+        self, max_threads: Optional[int] = None, max_processes: Optional[int] = None
+    ):
+        self.max_threads = max_threads or min(32, (os.cpu_count() or 1) + 4)
+        self.max_processes = max_processes or os.cpu_count() or 1
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def executor_for(self, backend: str) -> Optional[Executor]:
+        """
+        Get the pool for a backend
+        :param backend:
+        :return: None for the inline backend
+        """
+        if backend == INLINE:
+            return None
+        with self._lock:
+            if backend == THREAD:
+                if self._threads is None:
+                    self._threads = ThreadPoolExecutor(
+                        self.max_threads, thread_name_prefix="agent"
+                    )
+                return self._threads
+            if backend == PROCESS:
+                if self._processes is None:
+                    self._processes = ProcessPoolExecutor(self.max_processes)
+                return self._processes
+        raise ValueError(f"Unknown execution backend {backend}, expected one of {BACKENDS}")
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            for pool in (self._threads, self._processes):
+                if pool is not None:
+                    pool.shutdown(wait=wait)
+            self._threads = self._processes = None
+
+
+class ConcurrencyLimit:
+    """
+    Concurrency Limit class to cap an agent's running calls across threads
+    and event loops
+
+    Callers hand over a start function instead of blocking for a slot. It
+    runs at once if a slot is free, otherwise on the thread that releases
+    one, so waiting never ties up a pool thread.
+    """
+
+    def __init__(self, limit: int):
+        if limit < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.limit = limit
+        self.running = 0
+        self._waiting: Deque[Callable[[], None]] = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, start: Callable[[], None]):
+        """
+        Run start once a slot is free; it must arrange for release to be called
+        :param start:
+        :return:
+        """
+        with self._lock:
+            if self.running >= self.limit:
+                self._waiting.append(start)
+                return
+            self.running += 1
+        start()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            if granted.cancelled():  # The waiter gave up, pass the slot on
+                self.release()
+            else:
+                granted.set_result(None)
+
+        self.acquire(lambda: loop.call_soon_threadsafe(grant))
+        try:
+            await granted
+        except asyncio.CancelledError:
+            if granted.done() and not granted.cancelled():
+                self.release()  # Granted, but cancelled before it resumed
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiting:
+                self.running -= 1
+                return
+            start = self._waiting.popleft()  # The slot goes straight to it
+        start()
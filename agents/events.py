@@ -0,0 +1,154 @@
+import asyncio
+import fnmatch
+import threading
+from typing import Any, Dict, List, Optional
+
+
+class Subscription:
+    """
+    Subscription to an EventBus topic or pattern, backed by a bounded queue
+    """
+
+    def __init__(self, bus: "EventBus", pattern: str, max_pending: int):
+        self.bus = bus
+        self.pattern = pattern
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self.dropped = 0  # Oldest events discarded because the queue was full
+
+    def matches(self, topic: str) -> bool:
+        return topic == self.pattern or fnmatch.fnmatchcase(topic, self.pattern)
+
+    def _deliver(self, event: Dict[str, Any]):
+        # Events are triggers, so a slow subscriber keeps the newest ones
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the next event
+        :param timeout: seconds, or None to wait indefinitely
+        :return: the event, or None on timeout
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """
+    Event Bus class for agents to publish events that assignments react to
+
+    Topics are plain strings; subscriptions may use shell-style patterns such
+    as "room:*". publish may be called from any thread, including agent
+    functions running on the thread pool backend.
+    """
+
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    async def subscribe(self, pattern: str) -> Subscription:
+        subscription = Subscription(self, pattern, self.max_pending)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, topic: str, data: Any = None) -> int:
+        """
+        Publish an event to every matching subscription
+        :param topic:
+        :param data:
+        :return: number of subscriptions the event was delivered to
+        """
+        event = {"topic": topic, "data": data}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        with self._lock:
+            subscriptions = [s for s in self._subscriptions if s.matches(topic)]
+        for subscription in subscriptions:
+            if subscription.loop is running:
+                subscription._deliver(event)
+            else:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+        return len(subscriptions)
+
+
+def keyspace_channel(key_pattern: str, db: int = 0) -> str:
+    """
+    Channel pattern for Redis keyspace notifications on matching keys. The
+    server must have notify-keyspace-events enabled, e.g. "K$h" for string and
+    hash writes.
+    :param key_pattern:
+    :param db:
+    :return:
+    """
+    return f"__keyspace@{db}__:{key_pattern}"
+
+
+class RedisSubscription:
+    """
+    Subscription to a Redis pub/sub channel or pattern
+    """
+
+    def __init__(self, pubsub, pattern: str):
+        self.pubsub = pubsub
+        self.pattern = pattern
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Wait for the next published message
+        :param timeout: seconds, or None to wait indefinitely
+        :return: {"topic": channel, "data": payload}, or None on timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            message = await self.pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                channel, data = message["channel"], message["data"]
+                return {
+                    "topic": channel.decode() if isinstance(channel, bytes) else channel,
+                    "data": data.decode() if isinstance(data, bytes) else data,
+                }
+            if deadline is not None and loop.time() >= deadline:
+                return None
+
+    async def close(self):
+        await self.pubsub.punsubscribe(self.pattern)
+        await self.pubsub.close()
+
+
+class RedisEventSource:
+    """
+    Redis Event Source class to subscribe assignments to Redis pub/sub
+    channels or keyspace notifications, on an asyncio Redis client
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def subscribe(self, pattern: str) -> RedisSubscription:
+        pubsub = self.client.pubsub()
+        await pubsub.psubscribe(pattern)
+        return RedisSubscription(pubsub, pattern)
+
+    async def publish(self, channel: str, data: Any) -> int:
+        return await self.client.publish(channel, data)
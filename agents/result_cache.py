@@ -0,0 +1,157 @@
+import copy
+import hashlib
+import json
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from memory.llm_cache import TTLCache
+from tracing.tracer import tracer
+
+_MISSING = object()
+
+
+def function_identity(function: Callable) -> str:
+    # Module and qualified name, so a result outlives restarts but not renames
+    module = getattr(function, "__module__", None) or ""
+    return f"{module}.{getattr(function, '__qualname__', repr(function))}"
+
+
+class ResultCache:
+    """
+    Result Cache class to memoize deterministic agent functions
+
+    Results are kept in an in-memory LRU and, with a redis_client, in Redis so
+    other workers share them. Keys cover the agent, the function's name and
+    identity and the call's arguments. Error results are never cached.
+    Invalidation reaches this process's memory tier and the shared Redis tier;
+    other processes' memory tiers keep their copies until the ttl runs out.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 300,
+        redis_client=None,
+        prefix: str = "agent_result",
+    ):
+        """
+        :param max_entries:
+        :param ttl: default seconds a result is kept
+        :param redis_client: optional shared tier; results must be JSON-serialisable
+        :param prefix: Redis key prefix
+        """
+        self.memory = TTLCache(max_entries, ttl)
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        # Bumped by invalidate, so older in-memory entries are never looked up again
+        self._generations: Dict[Tuple[str, str], int] = {}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.memory)}
+
+    def key(
+        self,
+        agent_name: str,
+        function_name: str,
+        function: Callable,
+        input_data=None,
+        args: tuple = (),
+        kwargs: Optional[dict] = None,
+    ) -> str:
+        """
+        Cache key for one call of an agent function
+        :param agent_name:
+        :param function_name:
+        :param function:
+        :param input_data:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        call = json.dumps(
+            [function_identity(function), input_data, args, kwargs or {}],
+            sort_keys=True,
+            separators=(",", ":"),
+            default=repr,
+        )
+        digest = hashlib.sha256(call.encode()).hexdigest()
+        return f"{self.prefix}:{agent_name}:{function_name}:{digest}"
+
+    def _memory_key(self, agent_name: str, function_name: str, key: str) -> str:
+        generation = self._generations.get((agent_name, function_name), 0)
+        return f"{key}:{generation}"
+
+    def get(self, agent_name: str, function_name: str, key: str, default=None):
+        memory_key = self._memory_key(agent_name, function_name, key)
+        value = self.memory.get(memory_key, _MISSING)
+        if value is _MISSING and self.redis_client is not None:
+            raw = self.redis_client.get(key)
+            if raw is not None:
+                value = json.loads(raw)
+                self.memory.set(memory_key, value)  # Promote to the memory tier
+        if value is _MISSING:
+            self.misses += 1
+            tracer.count("agent_cache.misses")
+            return default
+        self.hits += 1
+        tracer.count("agent_cache.hits")
+        return copy.deepcopy(value)  # Callers may mutate what they get back
+
+    def set(
+        self,
+        agent_name: str,
+        function_name: str,
+        key: str,
+        value: Any,
+        ttl: Optional[float] = None,
+    ):
+        if isinstance(value, dict) and "error" in value:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        memory_key = self._memory_key(agent_name, function_name, key)
+        # A copy, so the caller mutating its result does not change later hits
+        self.memory.set(memory_key, copy.deepcopy(value), ttl)
+        if self.redis_client is None:
+            return
+        try:
+            raw = json.dumps(value)
+        except (TypeError, ValueError):
+            return  # Not shareable, keep it in this process only
+        ex = None if ttl is None else max(1, int(ttl))
+        index = self._index_key(agent_name, function_name)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.set(key, raw, ex=ex)
+        # Remember the key so invalidate can find it from any worker. The index
+        # expires with the newest result, so it does not outgrow the results
+        pipe.sadd(index, key)
+        if ex is not None:
+            pipe.expire(index, ex)
+        pipe.execute()
+
+    def _index_key(self, agent_name: str, function_name: str) -> str:
+        return f"{self.prefix}:keys:{agent_name}:{function_name}"
+
+    def invalidate(self, agent_name: str, function_name: str):
+        """
+        Drop every cached result of one agent function
+        :param agent_name:
+        :param function_name:
+        :return:
+        """
+        generation = self._generations.get((agent_name, function_name), 0)
+        self._generations[(agent_name, function_name)] = generation + 1
+        if self.redis_client is None:
+            return
+        index = self._index_key(agent_name, function_name)
+        keys = self.redis_client.smembers(index)
+        pipe = self.redis_client.pipeline(transaction=True)
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(index)
+        pipe.execute()
+
+    def clear(self):
+        self.memory.clear()
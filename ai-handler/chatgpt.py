@@ -1,18 +1,25 @@
 import os
-import openai
+from typing import AsyncIterator, Optional
+
 from pydantic import BaseModel, Field
 
+from memory.llm_cache import ResponseCache, make_cache_key
+from tracing.tracer import tracer
+
 
 class OpenAIQuery(BaseModel):
     user_message: str = Field(..., description="Message from the user")
     assistant_message: str = Field(..., description="Previous message from the assistant")
+    model: str = Field("gpt-3.5-turbo", description="Chat model to query")
+    temperature: float = 1
+    max_tokens: int = 256
+    top_p: float = 1
+    frequency_penalty: float = 0
+    presence_penalty: float = 0
+    api_base: Optional[str] = Field(None, description="Override the API URL, e.g. a local server")
 
-    def query_openai_gpt(self):
-        # Set API key from environment variable
-        api_key = os.getenv("OPENAI_API_KEY")
-
-        # Construct messages
-        messages = [
+    def build_messages(self):
+        return [
             {
                 "role": "user",
                 "content": self.user_message
@@ -23,17 +30,83 @@ class OpenAIQuery(BaseModel):
             }
         ]
 
+    def sampling_params(self):
+        return {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "top_p": self.top_p,
+            "frequency_penalty": self.frequency_penalty,
+            "presence_penalty": self.presence_penalty,
+        }
+
+    def cache_key(self) -> str:
+        return make_cache_key(self.model, self.build_messages(), **self.sampling_params())
+
+    def query_openai_gpt(self, cache: Optional[ResponseCache] = None):
+        # Answer repeated requests from the cache without calling the API
+        if cache is not None:
+            return cache.get_or_compute(self.cache_key(), self._query_openai_gpt)
+        return self._query_openai_gpt()
+
+    def _query_openai_gpt(self):
+        import openai  # Deferred so importing this module stays cheap
+
+        # Set API key from environment variable
+        api_key = os.getenv("OPENAI_API_KEY")
+
         # Make API call
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            temperature=1,
-            max_tokens=256,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0
-        )
+        with tracer.span("llm.call", model=self.model):
+            response = openai.ChatCompletion.create(
+                model=self.model,
+                messages=self.build_messages(),
+                api_base=self.api_base,
+                **self.sampling_params()
+            )
+        self._count_tokens(response)
 
         # Extract and return the assistant's reply as a string
         assistant_reply = response['choices'][0]['message']['content']
         return assistant_reply
+
+    async def aquery_openai_gpt(self):
+        """
+        Query the model without blocking the event loop, e.g. from LLMDispatcher
+        :return:
+        """
+        import openai
+
+        with tracer.span("llm.call", model=self.model):
+            response = await openai.ChatCompletion.acreate(
+                model=self.model,
+                messages=self.build_messages(),
+                api_base=self.api_base,
+                **self.sampling_params()
+            )
+        self._count_tokens(response)
+        return response['choices'][0]['message']['content']
+
+    @staticmethod
+    def _count_tokens(response):
+        usage = response.get('usage') or {}
+        tracer.count("llm.prompt_tokens", usage.get('prompt_tokens', 0))
+        tracer.count("llm.completion_tokens", usage.get('completion_tokens', 0))
+
+    async def stream_openai_gpt(self) -> AsyncIterator[str]:
+        """
+        Stream the assistant's reply as token deltas
+        :return:
+        """
+        import openai
+
+        response = await openai.ChatCompletion.acreate(
+            model=self.model,
+            messages=self.build_messages(),
+            stream=True,
+            api_base=self.api_base,
+            **self.sampling_params()
+        )
+
+        async for chunk in response:
+            delta = chunk['choices'][0].get('delta', {}).get('content')
+            if delta:
+                yield delta
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from tracing.tracer import tracer
+
+
+class TokenBucket:
+    """
+    Token Bucket class to limit a rate per minute, allowing bursts up to capacity
+    """
+
+    def __init__(
+        self,
+        per_minute: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute if capacity is None else capacity
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        """
+        Wait until amount tokens are available and take them
+        :param amount: clamped to the bucket capacity
+        :return:
+        """
+        amount = min(amount, self.capacity)
+        async with self._lock:  # Waiters are served in arrival order
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+def default_request_key(request: Any) -> str:
+    if hasattr(request, "cache_key"):
+        return request.cache_key()
+    return hashlib.sha256(repr(request).encode()).hexdigest()
+
+
+def default_token_estimate(request: Any) -> int:
+    # Roughly four characters per token for the prompt, plus the reply budget
+    if hasattr(request, "build_messages"):
+        prompt = sum(len(message["content"]) for message in request.build_messages())
+        return prompt // 4 + getattr(request, "max_tokens", 0)
+    return 1
+
+
+class LLMDispatcher:
+    """
+    LLM Dispatcher class to run LLM requests concurrently under shared limits
+
+    Requests are rate limited by request and token buckets, identical
+    in-flight requests share one future, failures are retried with jittered
+    exponential backoff, and a slow attempt can be hedged with a second one.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Any], Awaitable[Any]],
+        requests_per_minute: float = 3500,
+        tokens_per_minute: float = 90000,
+        max_concurrency: int = 64,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        hedge_after: Optional[float] = None,
+        retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+        request_key: Callable[[Any], str] = default_request_key,
+        estimate_tokens: Callable[[Any], int] = default_token_estimate,
+    ):
+        self.send = send
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.retry_on = retry_on
+        self.request_key = request_key
+        self.estimate_tokens = estimate_tokens
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "coalesced": 0,
+            "attempts": 0,
+            "retries": 0,
+            "hedges": 0,
+            "failures": 0,
+        }
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    async def submit(self, request: Any) -> Any:
+        """
+        Send a request, joining an identical one that is already in flight
+        :param request:
+        :return: the backend's reply
+        """
+        self.stats["requests"] += 1
+        key = self.request_key(request)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            tracer.count("llm.coalesced")
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self._send_with_retries(request))
+        self._in_flight[key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def submit_many(self, requests) -> list:
+        """
+        Send several requests concurrently
+        :param requests:
+        :return: replies in request order, exceptions in place of failed ones
+        """
+        return await asyncio.gather(
+            *(self.submit(request) for request in requests), return_exceptions=True
+        )
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retrying clients from synchronising
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def _send_with_retries(self, request: Any) -> Any:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._send_hedged(request)
+            except self.retry_on:
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                tracer.count("llm.retries")
+                await asyncio.sleep(self._backoff(attempt))
+
+    async def _send_hedged(self, request: Any) -> Any:
+        if self.hedge_after is None:
+            return await self._send_once(request)
+
+        first = asyncio.ensure_future(self._send_once(request))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+
+        self.stats["hedges"] += 1
+        tracer.count("llm.hedges")
+        attempts = {first, asyncio.ensure_future(self._send_once(request))}
+        try:
+            while attempts:
+                done, attempts = await asyncio.wait(
+                    attempts, return_when=asyncio.FIRST_COMPLETED
+                )
+                for attempt in done:
+                    if attempt.exception() is None:
+                        return attempt.result()
+            # Both attempts failed, surface the last error to the retry loop
+            return attempt.result()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    async def _send_once(self, request: Any) -> Any:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        await self.request_bucket.acquire()
+        await self.token_bucket.acquire(self.estimate_tokens(request))
+        async with self._semaphore:
+            self.stats["attempts"] += 1
+            return await self.send(request)
@@ -0,0 +1,233 @@
+import asyncio
+import fnmatch
+from typing import Any, Dict, List, Optional, Sequence
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the subset of redis.Redis the memory layer uses,
+    so benchmarks measure our code rather than the network
+    """
+
+    def __init__(self):
+        self.data: Dict[str, Any] = {}
+        self.expiry: Dict[str, int] = {}
+
+    def _encode(self, value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        fields = self.data.setdefault(name, {})
+        if key is not None:
+            fields[self._encode(key)] = self._encode(value)
+        for k, v in (mapping or {}).items():
+            fields[self._encode(k)] = self._encode(v)
+        return len(mapping or {}) + (key is not None)
+
+    def hgetall(self, name) -> Dict[bytes, bytes]:
+        return dict(self.data.get(name, {}))
+
+    def hget(self, name, key) -> Optional[bytes]:
+        return self.data.get(name, {}).get(self._encode(key))
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def set(self, name, value, ex=None):
+        self.data[name] = self._encode(value)
+        self.expiry.pop(name, None)
+        if ex is not None:
+            self.expiry[name] = ex
+        return True
+
+    def expire(self, name, seconds: int) -> bool:
+        # Expiry is recorded, not enforced, so tests can check it was set
+        if name not in self.data:
+            return False
+        self.expiry[name] = seconds
+        return True
+
+    def ttl(self, name) -> int:
+        if name not in self.data:
+            return -2
+        return self.expiry.get(name, -1)
+
+    def incrby(self, name, amount: int = 1) -> int:
+        value = int(self.data.get(name, 0)) + amount
+        self.data[name] = self._encode(value)
+        return value
+
+    def zadd(self, name, mapping) -> int:
+        members = self.data.setdefault(name, {})
+        added = sum(self._encode(member) not in members for member in mapping)
+        for member, score in mapping.items():
+            members[self._encode(member)] = float(score)
+        return added
+
+    def _sorted(self, name) -> List[tuple]:
+        return sorted(self.data.get(name, {}).items(), key=lambda item: (item[1], item[0]))
+
+    @staticmethod
+    def _slice(items: list, start: int, end: int) -> list:
+        # Redis ranges include end, and count negative indexes from the back
+        if start < 0:
+            start += len(items)
+        if end < 0:
+            end += len(items)
+        return items[max(start, 0) : end + 1]
+
+    def zrange(self, name, start: int, end: int, withscores: bool = False) -> list:
+        items = self._slice(self._sorted(name), start, end)
+        return items if withscores else [member for member, _ in items]
+
+    def zrevrange(self, name, start: int, end: int, withscores: bool = False) -> list:
+        items = self._slice(self._sorted(name)[::-1], start, end)
+        return items if withscores else [member for member, _ in items]
+
+    def _zremove(self, name, members) -> int:
+        zset = self.data.get(name, {})
+        removed = sum(zset.pop(member, None) is not None for member in members)
+        if not zset:
+            self.delete(name)  # Like Redis, an emptied sorted set is deleted
+        return removed
+
+    def zrem(self, name, *members) -> int:
+        return self._zremove(name, [self._encode(member) for member in members])
+
+    def zremrangebyrank(self, name, start: int, end: int) -> int:
+        return self._zremove(name, self.zrange(name, start, end))
+
+    def zremrangebyscore(self, name, low, high) -> int:
+        low, high = float(low), float(high)
+        return self._zremove(
+            name, [m for m, score in self._sorted(name) if low <= score <= high]
+        )
+
+    def delete(self, *names) -> int:
+        for name in names:
+            self.expiry.pop(name, None)
+        return sum(self.data.pop(name, None) is not None for name in names)
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self.commands: List[tuple] = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self) -> list:
+        commands, self.commands = self.commands, []
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class FakeAsyncRedis:
+    """
+    In-memory stand-in for the pub/sub subset of redis.asyncio.Redis, so
+    event sources can be exercised without a server
+    """
+
+    def __init__(self):
+        self.pubsubs: List["FakePubSub"] = []
+
+    def pubsub(self) -> "FakePubSub":
+        pubsub = FakePubSub(self)
+        self.pubsubs.append(pubsub)
+        return pubsub
+
+    async def publish(self, channel: str, data) -> int:
+        return sum(pubsub._deliver(channel, data) for pubsub in list(self.pubsubs))
+
+
+class FakePubSub:
+    def __init__(self, client: FakeAsyncRedis):
+        self.client = client
+        self.patterns: List[str] = []
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    async def psubscribe(self, *patterns: str):
+        for pattern in patterns:
+            if pattern not in self.patterns:
+                self.patterns.append(pattern)
+            self.messages.put_nowait(
+                {
+                    "type": "psubscribe",
+                    "pattern": None,
+                    "channel": self._encode(pattern),
+                    "data": len(self.patterns),
+                }
+            )
+
+    async def punsubscribe(self, *patterns: str):
+        # Like Redis, no patterns means all of them
+        for pattern in patterns or list(self.patterns):
+            if pattern in self.patterns:
+                self.patterns.remove(pattern)
+
+    def _deliver(self, channel: str, data) -> int:
+        matched = [p for p in self.patterns if fnmatch.fnmatchcase(channel, p)]
+        for pattern in matched:
+            self.messages.put_nowait(
+                {
+                    "type": "pmessage",
+                    "pattern": self._encode(pattern),
+                    "channel": self._encode(channel),
+                    "data": self._encode(data),
+                }
+            )
+        return len(matched)
+
+    async def get_message(
+        self, ignore_subscribe_messages: bool = False, timeout: Optional[float] = 0.0
+    ) -> Optional[dict]:
+        try:
+            message = await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if ignore_subscribe_messages and message["type"] != "pmessage":
+            return None
+        return message
+
+    async def close(self):
+        self.patterns.clear()
+        self.closed = True
+        if self in self.client.pubsubs:
+            self.client.pubsubs.remove(self)
+
+
+class FakeLLM:
+    """
+    In-process stand-in for an LLM endpoint, usable as LLMDispatcher's send.
+    Call n sleeps for latencies[n] (or latency) and the first failures calls
+    raise ConnectionError
+    """
+
+    def __init__(
+        self, latency: float = 0.0, failures: int = 0, latencies: Sequence[float] = ()
+    ):
+        self.latency = latency
+        self.failures = failures
+        self.latencies = list(latencies)
+        self.calls: List[Any] = []
+
+    async def __call__(self, request) -> Dict[str, Any]:
+        call = len(self.calls)
+        self.calls.append(request)
+        latency = self.latencies[call] if call < len(self.latencies) else self.latency
+        await asyncio.sleep(latency)
+        if call < self.failures:
+            raise ConnectionError(f"Fake failure of call {call + 1}")
+        return {"request": request, "reply": f"Reply to {request}", "call": call}
@@ -0,0 +1,101 @@
+"""
+Import-time budget check for the package entry points.
+
+    python -m benchmarks.importtime
+    python -m benchmarks.importtime --scale 2
+
+Each module is imported in a fresh interpreter under -X importtime. The
+check fails if its cumulative import time exceeds the budget, or if it
+loads a heavy backend that should only be imported on first use.
+"""
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+# Cumulative import time budgets in milliseconds, with headroom for noisy
+# machines; loading openai, redis or numpy eagerly blows well past them
+BUDGETS_MS = {
+    "shareef": 10,
+    "tracing.tracer": 60,
+    "memory.codec": 80,
+    "chain.templatebase": 200,
+    "memory.buffer_manager": 200,
+    "agents.agent_manager": 200,
+    "reasoning.reasoner": 300,
+}
+
+# Backends that must not be loaded just by importing our modules
+HEAVY_MODULES = ("openai", "redis", "numpy", "sqlite3", "msgpack", "tiktoken")
+
+
+def measure_import(module: str, repeat: int = 3) -> Dict[str, object]:
+    """
+    Import module in fresh interpreters, keeping the fastest run
+    :param module:
+    :param repeat:
+    :return: cumulative import time in ms and the heavy modules it loaded
+    """
+    script = (
+        f"import {module}, sys; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    best = None
+    loaded: List[str] = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        cumulative = None
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == module:
+                cumulative = int(fields[1]) / 1000
+        if cumulative is not None and (best is None or cumulative < best):
+            best = cumulative
+        loaded = [name for name in result.stdout.strip().split(",") if name]
+    return {"ms": best or 0.0, "heavy": loaded}
+
+
+def check(budgets: Dict[str, float], scale: float = 1.0, repeat: int = 3) -> List[str]:
+    """
+    Print each module's import time against its budget
+    :param budgets:
+    :param scale: multiplier for the budgets, e.g. on slow CI machines
+    :param repeat:
+    :return: modules that are over budget or load a heavy backend
+    """
+    failures = []
+    for module, budget in budgets.items():
+        result = measure_import(module, repeat)
+        budget *= scale
+        flag = ""
+        if result["ms"] > budget:
+            flag = "  OVER BUDGET"
+        if result["heavy"]:
+            flag += f"  LOADS {','.join(result['heavy'])}"
+        if flag:
+            failures.append(module)
+        print(f"{module:25} {result['ms']:>8.1f} ms / {budget:>6.1f} ms{flag}")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="budget multiplier")
+    parser.add_argument("--repeat", type=int, default=3, help="imports per module")
+    parser.add_argument("modules", nargs="*", help="only check these modules")
+    args = parser.parse_args(argv)
+
+    budgets = BUDGETS_MS
+    if args.modules:
+        budgets = {module: BUDGETS_MS.get(module, 100) for module in args.modules}
+    return 1 if check(budgets, args.scale, args.repeat) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
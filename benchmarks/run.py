@@ -0,0 +1,301 @@
+"""
+Microbenchmarks for the chain, memory and agent hot paths.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --compare bench.json --threshold 0.15
+
+Results are JSON so runs on different commits can be compared. The LLM is
+the deterministic LLMSetup stand-in and Redis is an in-memory fake unless
+--redis-url points at a real (ideally throwaway) server.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+from typing import Callable, Dict, List, Optional
+
+from agents.agent_manager import AgentManager, DynamicAgent
+from agents.result_cache import ResultCache
+from benchmarks.fakes import FakeRedis
+from chain.simplebase import SimpleChain, execute_simple_chain
+from chain.templatebase import TemplateChain, execute_chain
+from memory.buffer_manager import ConversationBuffer
+from memory.codec import BinaryCodec
+from memory.keyspace import HashRing, SessionStore
+from memory.redis_manager import (
+    RedisManager,
+    fetch_from_redis,
+    fetch_many_from_redis,
+    upload_to_redis,
+)
+
+
+def measure(fn: Callable[[], object], number: int, repeat: int) -> Dict[str, float]:
+    """
+    Time fn, returning per-call statistics in nanoseconds over repeat rounds
+    :param fn:
+    :param number: calls per round
+    :param repeat: rounds
+    :return:
+    """
+    fn()  # Warm caches and lazy imports outside the measurement
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter_ns() - start) / number)
+    return {
+        "min_ns": min(rounds),
+        "median_ns": statistics.median(rounds),
+        "mean_ns": statistics.fmean(rounds),
+        "stdev_ns": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _conversation_json(i: int) -> str:
+    return json.dumps(
+        {
+            "question": f"What is the status of order {i}?",
+            "answer": f"Order {i} shipped yesterday and arrives tomorrow.",
+            "agents": ["OrderAgent", "ShippingAgent"],
+            "reason": "Looked up the order and its shipment.",
+        }
+    )
+
+
+def _conversations(count: int) -> List[RedisManager]:
+    return [
+        RedisManager(
+            question=f"Question {i}",
+            answer=f"Answer {i}",
+            agents=["Agent1", "Agent2"],
+            reason="Because",
+            pre_context=None,
+        )
+        for i in range(count)
+    ]
+
+
+def _manager(agent_count: int, result_cache: Optional[ResultCache] = None) -> AgentManager:
+    manager = AgentManager(result_cache=result_cache)
+    for i in range(agent_count):
+        manager.register_agent(
+            DynamicAgent(
+                f"Agent{i}",
+                f"Agent number {i}",
+                "JSON",
+                {"lookup": lambda x: {"result": x, "success": True}, "noop": lambda x: None},
+                cacheable=["lookup"],
+            )
+        )
+    return manager
+
+
+def chain_benchmarks(number: int, repeat: int) -> Dict[str, dict]:
+    template = TemplateChain(
+        template_prompt="Given the objective {0} for user {1}, generate tasks.",
+        inputs=["book a flight", "alice"],
+        memory="Previous Q: hi, Previous A: hello",
+    )
+    upper = TemplateChain(
+        template_prompt="Hello {0}", inputs=["World"], callback="to_upper"
+    )
+    simple = SimpleChain(prompt="Hello World", memory="Memory: User says Hi!")
+    return {
+        "execute_chain.to_json": measure(lambda: execute_chain(template), number, repeat),
+        "execute_chain.to_upper": measure(lambda: execute_chain(upper), number, repeat),
+        "execute_simple_chain": measure(
+            lambda: execute_simple_chain(simple), number, repeat
+        ),
+    }
+
+
+def buffer_benchmarks(redis_client, number: int, repeat: int) -> Dict[str, dict]:
+    payloads = [_conversation_json(i) for i in range(5)]
+    buffer = ConversationBuffer(redis_client)
+    counter = iter(range(10**12))
+
+    def add():
+        buffer.add_conversation(payloads[next(counter) % 5])
+
+    def add_trusted():
+        buffer.add_conversation(payloads[next(counter) % 5], trusted=True)
+
+    def fill_and_flush():
+        flushing = ConversationBuffer(redis_client, flush_size=5)
+        for payload in payloads[:4]:
+            flushing.add_conversation(payload)
+        flushing.process_buffer()
+
+    return {
+        "buffer.add_conversation": measure(add, number, repeat),
+        "buffer.add_conversation.trusted": measure(add_trusted, number, repeat),
+        "buffer.process_buffer": measure(fill_and_flush, max(1, number // 10), repeat),
+    }
+
+
+def redis_benchmarks(redis_client, number: int, repeat: int) -> Dict[str, dict]:
+    # upload_to_redis is deprecated, but still timed so runs stay comparable
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        conversations = _conversations(5)
+        upload_to_redis(redis_client, conversations, "pre-context")
+        ids = [str(i) for i in range(5)]
+        codec = BinaryCodec()
+        binary_client = (
+            FakeRedis() if isinstance(redis_client, FakeRedis) else redis_client
+        )
+        upload_to_redis(binary_client, conversations, "pre-context", codec=codec)
+        store = SessionStore(HashRing({"default": redis_client}))
+        binary_store = SessionStore(HashRing({"default": binary_client}), codec=codec)
+        return {
+            "redis.upload_to_redis[5]": measure(
+                lambda: upload_to_redis(redis_client, conversations, "pre-context"),
+                number,
+                repeat,
+            ),
+            "redis.fetch_from_redis": measure(
+                lambda: fetch_from_redis(redis_client, "0"), number, repeat
+            ),
+            "redis.fetch_many_from_redis[5]": measure(
+                lambda: fetch_many_from_redis(redis_client, ids), number, repeat
+            ),
+            "redis.upload_to_redis[5].binary": measure(
+                lambda: upload_to_redis(
+                    binary_client, conversations, "pre-context", codec=codec
+                ),
+                number,
+                repeat,
+            ),
+            "redis.fetch_many_from_redis[5].binary": measure(
+                lambda: fetch_many_from_redis(binary_client, ids, codec), number, repeat
+            ),
+            "keyspace.append[5]": measure(
+                lambda: store.append("bench", "append", conversations, "pre-context"),
+                number,
+                repeat,
+            ),
+            "keyspace.append[5].binary": measure(
+                lambda: binary_store.append(
+                    "bench", "append", conversations, "pre-context"
+                ),
+                number,
+                repeat,
+            ),
+        }
+
+
+def agent_benchmarks(number: int, repeat: int) -> Dict[str, dict]:
+    results = {}
+    manager = _manager(100)
+    results["agents.execute_function"] = measure(
+        lambda: manager.execute_function("Agent50", "lookup", {"id": 1}), number, repeat
+    )
+    cached = _manager(100, ResultCache())
+    results["agents.execute_function.cache_hit"] = measure(
+        lambda: cached.execute_function("Agent50", "lookup", {"id": 1}), number, repeat
+    )
+    for agent_count in (10, 100, 1000):
+        manager = _manager(agent_count)
+        rounds = max(1, number // agent_count)
+
+        def cold():
+            manager._changed()  # Drop cached prompts as a registration would
+            manager._agent_prompts.clear()
+            return manager.generate_prompt()
+
+        results[f"agents.generate_prompt[{agent_count}].cold"] = measure(
+            cold, rounds, repeat
+        )
+        results[f"agents.generate_prompt[{agent_count}].cached"] = measure(
+            manager.generate_prompt, number, repeat
+        )
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(number: int, repeat: int, redis_url: Optional[str] = None) -> dict:
+    if redis_url:
+        import redis
+
+        redis_client = redis.Redis.from_url(redis_url)
+    else:
+        redis_client = FakeRedis()
+
+    benchmarks = {}
+    benchmarks.update(chain_benchmarks(number, repeat))
+    benchmarks.update(buffer_benchmarks(redis_client, number, repeat))
+    benchmarks.update(redis_benchmarks(redis_client, number, repeat))
+    benchmarks.update(agent_benchmarks(number, repeat))
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "redis": redis_url or "fake",
+        "benchmarks": benchmarks,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Print the change in median time against a baseline run
+    :param current:
+    :param baseline:
+    :param threshold: relative slowdown reported as a regression
+    :return: names of regressed benchmarks
+    """
+    regressions = []
+    for name, result in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            print(f"{name:45} new")
+            continue
+        change = result["median_ns"] / before["median_ns"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:45} {before['median_ns']:>12.0f} -> {result['median_ns']:>12.0f} ns  {change:+.1%}{flag}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=1000, help="calls per round")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds per benchmark")
+    parser.add_argument("--redis-url", help="benchmark against a real Redis server")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args.number, args.repeat, args.redis_url)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            return 1 if compare(results, json.load(f), args.threshold) else 0
+    if not args.output:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
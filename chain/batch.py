@@ -0,0 +1,127 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from chain.simplebase import LLMSetup, SimpleChain, resolve_callback
+from chain.templatebase import TemplateChain, compile_template
+
+
+def _finish(
+    prompt_key: str,
+    prompts: List[Optional[str]],
+    memories: List[Optional[str]],
+    callbacks: List[Any],
+    errors: Dict[int, Dict[str, str]],
+    max_workers: int,
+) -> List[Any]:
+    # Send only the prompts that rendered, then apply callbacks in order
+    pending = [i for i in range(len(prompts)) if i not in errors]
+    generated = LLMSetup.generate_prompts(
+        [prompts[i] for i in pending], [memories[i] for i in pending], max_workers
+    )
+
+    results: List[Any] = [None] * len(prompts)
+    for i, error in errors.items():
+        results[i] = error
+    resolved: Dict[Any, Any] = {}
+    for i, generated_code in zip(pending, generated):
+        if isinstance(generated_code, Exception):
+            results[i] = {"error": f"Generation failed: {generated_code}"}
+            continue
+        output = {prompt_key: prompts[i], "generated_code": generated_code}
+        key = callbacks[i] if isinstance(callbacks[i], str) else id(callbacks[i])
+        if key not in resolved:
+            resolved[key] = resolve_callback(callbacks[i])
+        callback = resolved[key]
+        try:
+            results[i] = callback(output) if callback else output
+        except Exception as exc:
+            results[i] = {"error": f"Callback failed: {exc}"}
+    return results
+
+
+def execute_template_batch(
+    template_prompt: str,
+    rows: Sequence[Sequence[str]],
+    callback: Optional[Union[Callable[[Dict], Any], str]] = "to_json",
+    memory: Optional[str] = None,
+    max_workers: int = 8,
+) -> List[Any]:
+    """
+    Execute one template over many input rows
+    :param template_prompt:
+    :param rows: inputs for each execution
+    :param callback:
+    :param memory:
+    :param max_workers: concurrent requests to the LLM backend
+    :return: one output per row, in order, with {"error": ...} for failed rows
+    """
+    compiled = compile_template(template_prompt)
+    prompts: List[Optional[str]] = []
+    errors: Dict[int, Dict[str, str]] = {}
+    for i, inputs in enumerate(rows):
+        if len(inputs) != compiled.arity:
+            errors[i] = {"error": "Mismatch between placeholders and inputs."}
+            prompts.append(None)
+        else:
+            prompts.append(compiled.render(inputs))
+    return _finish(
+        "built_prompt",
+        prompts,
+        [memory] * len(prompts),
+        [callback] * len(prompts),
+        errors,
+        max_workers,
+    )
+
+
+def execute_chain_batch(
+    template_chains: Sequence[TemplateChain], max_workers: int = 8
+) -> List[Any]:
+    """
+    Execute many chains together
+    :param template_chains:
+    :param max_workers: concurrent requests to the LLM backend
+    :return: one output per chain, in order, with {"error": ...} for failed chains
+    """
+    prompts: List[Optional[str]] = []
+    errors: Dict[int, Dict[str, str]] = {}
+    for i, chain in enumerate(template_chains):
+        try:
+            prompts.append(compile_template(chain.template_prompt).render(chain.inputs))
+        except (IndexError, ValueError):
+            errors[i] = {"error": "Mismatch between placeholders and inputs."}
+            prompts.append(None)
+    return _finish(
+        "built_prompt",
+        prompts,
+        [chain.memory for chain in template_chains],
+        [chain.callback for chain in template_chains],
+        errors,
+        max_workers,
+    )
+
+
+def execute_simple_chain_batch(
+    simple_chains: Sequence[SimpleChain], max_workers: int = 8
+) -> List[Any]:
+    """
+    Execute many simple chains together
+    :param simple_chains:
+    :param max_workers: concurrent requests to the LLM backend
+    :return: one output per chain, in order, with {"error": ...} for failed chains
+    """
+    return _finish(
+        "prompt",
+        [chain.prompt for chain in simple_chains],
+        [chain.memory for chain in simple_chains],
+        [chain.callback for chain in simple_chains],
+        {},
+        max_workers,
+    )
+
+
+# Examples:
+"""
+rows = [["World"], ["There"], []]
+results = execute_template_batch("Hello {0}", rows, callback="to_upper")
+# The third row has no input for {0}, so results[2] is an error dict
+"""
@@ -0,0 +1,261 @@
+import asyncio
+import copy
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from chain.simplebase import SimpleChain, execute_simple_chain, resolve_callback
+from chain.templatebase import TemplateChain, execute_chain
+from memory.llm_cache import TTLCache
+from tracing.tracer import tracer
+
+_MISSING = object()
+
+Step = Union[TemplateChain, SimpleChain, Callable[..., Any]]
+
+
+def _reference(value) -> Optional[str]:
+    # "$name" refers to the output of node name, or to the run parameter name
+    if isinstance(value, str) and value.startswith("$") and len(value) > 1:
+        return value[1:]
+    return None
+
+
+def _identity(step) -> str:
+    if step is None:
+        return "none"
+    if isinstance(step, TemplateChain):
+        return f"template:{step.template_prompt}"
+    if isinstance(step, SimpleChain):
+        return f"simple:{step.prompt}"
+    # Every lambda shares a qualname, so callables are told apart by object;
+    # the cache lives with the pipeline, which holds them alive
+    name = getattr(step, "__qualname__", type(step).__qualname__)
+    return f"callable:{getattr(step, '__module__', '')}.{name}:{id(step)}"
+
+
+class PipelineNode:
+    """
+    One step of a Pipeline and the names its inputs come from
+    """
+
+    __slots__ = ("name", "step", "inputs", "memory", "callback", "references")
+
+    def __init__(self, name: str, step: Step, inputs: Sequence[Any], memory, callback):
+        self.name = name
+        self.step = step
+        self.inputs = list(inputs)
+        self.memory = memory
+        self.callback = callback
+        self.references = [
+            ref for ref in map(_reference, [*self.inputs, memory]) if ref is not None
+        ]
+
+
+class Pipeline:
+    """
+    Pipeline class to run chains and callbacks as a DAG
+
+    A string input of the form "$name" is the generated text of an earlier
+    node, or the run parameter name. Nodes whose inputs are ready run
+    concurrently, and each node's output is cached by the hash of its
+    resolved inputs, so running again after changing one parameter only
+    recomputes the nodes downstream of it.
+    """
+
+    def __init__(self, max_workers: int = 8, cache_size: int = 256):
+        """
+        :param max_workers: nodes running at once
+        :param cache_size: node outputs kept, None disables the cache
+        """
+        self.max_workers = max_workers
+        self.nodes: Dict[str, PipelineNode] = {}
+        self.parameters = set()
+        self.cache = TTLCache(cache_size, ttl=None) if cache_size else None
+        self.hits = 0
+        self.misses = 0
+
+    def add(
+        self,
+        name: str,
+        step: Step,
+        inputs: Optional[Sequence[Any]] = None,
+        memory: Optional[str] = None,
+    ) -> "Pipeline":
+        """
+        Add a node. A TemplateChain's own inputs and memory may hold "$name"
+        references; a SimpleChain's memory may; a callable is called with the
+        resolved inputs
+        :param name:
+        :param step: TemplateChain, SimpleChain or callable
+        :param inputs: for a callable, its positional arguments
+        :param memory: overrides the chain's memory
+        :return: the pipeline, so calls can be chained
+        """
+        if name in self.nodes or name in self.parameters:
+            raise ValueError(f"Name {name} is already used in this pipeline")
+        callback = None
+        if isinstance(step, TemplateChain):
+            inputs = step.inputs
+            memory = memory if memory is not None else step.memory
+            callback = step.callback
+        elif isinstance(step, SimpleChain):
+            inputs = ()
+            memory = memory if memory is not None else step.memory
+            callback = step.callback
+        elif not callable(step):
+            raise TypeError(f"Node {name} must be a chain or a callable")
+
+        node = PipelineNode(name, step, inputs or (), memory, callback)
+        for ref in node.references:
+            if ref not in self.nodes:
+                self.parameters.add(ref)  # Anything that is not an earlier node
+        self.nodes[name] = node
+        return self
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    def run(self, **params) -> Dict[str, Any]:
+        """
+        Run the pipeline from synchronous code
+        :param params: values for the "$name" references that are not nodes
+        :return:
+        """
+        return asyncio.run(self.run_async(**params))
+
+    @tracer.traced("chain.pipeline")
+    async def run_async(self, **params) -> Dict[str, Any]:
+        """
+        Run every node, each as soon as the nodes it reads from are done
+        :param params: values for the "$name" references that are not nodes
+        :return: mapping of node name to its result, with the node's callback
+            applied, or {"error": ...}
+        """
+        missing = self.parameters - params.keys()
+        if missing:
+            raise ValueError(f"Missing pipeline parameters: {', '.join(sorted(missing))}")
+
+        semaphore = asyncio.Semaphore(self.max_workers)
+        values: Dict[str, Any] = dict(params)  # Text each node hands downstream
+        results: Dict[str, Any] = {}
+        pending: Dict[str, asyncio.Task] = {}
+        for node in self.nodes.values():
+            dependencies = [pending[ref] for ref in node.references if ref in pending]
+            pending[node.name] = asyncio.ensure_future(
+                self._run_node(node, dependencies, values, results, semaphore)
+            )
+        await asyncio.gather(*pending.values())
+        return {name: results[name] for name in self.nodes}
+
+    async def _run_node(
+        self,
+        node: PipelineNode,
+        dependencies: List[asyncio.Task],
+        values: Dict[str, Any],
+        results: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+    ):
+        if dependencies:
+            await asyncio.gather(*dependencies)
+        for ref in node.references:
+            if ref in self.nodes and values.get(ref, _MISSING) is _MISSING:
+                results[node.name] = {"error": f"Input {ref} of {node.name} failed"}
+                return
+
+        inputs = [self._resolve(value, values) for value in node.inputs]
+        memory = self._resolve(node.memory, values)
+        key = None
+        if self.cache is not None:
+            key = hashlib.sha256(
+                json.dumps(
+                    [
+                        node.name,
+                        _identity(node.step),
+                        _identity(resolve_callback(node.callback)),
+                        inputs,
+                        memory,
+                    ],
+                    default=repr,
+                ).encode()
+            ).hexdigest()
+            cached = self.cache.get(key, _MISSING)
+            if cached is not _MISSING:
+                self.hits += 1
+                tracer.count("pipeline.hits")
+                # A copy, so results the caller mutated stay out of later runs
+                values[node.name], results[node.name] = copy.deepcopy(cached)
+                return
+            self.misses += 1
+            tracer.count("pipeline.misses")
+
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            with tracer.span("chain.pipeline.node", node=node.name):
+                value, result = await loop.run_in_executor(
+                    None, self._execute, node, inputs, memory
+                )
+        results[node.name] = result
+        if value is _MISSING:
+            return
+        values[node.name] = value
+        if key is not None:
+            self.cache.set(key, copy.deepcopy((value, result)))
+
+    @staticmethod
+    def _resolve(value, values: Dict[str, Any]):
+        ref = _reference(value)
+        if ref is None:
+            return value
+        resolved = values[ref]
+        return resolved if isinstance(resolved, str) else json.dumps(resolved, default=str)
+
+    @staticmethod
+    def _execute(node: PipelineNode, inputs: List[Any], memory: Optional[str]):
+        # (value for downstream nodes, reported result); _MISSING value on error
+        try:
+            if isinstance(node.step, TemplateChain):
+                output = execute_chain(
+                    TemplateChain.trusted(
+                        node.step.template_prompt, inputs, callback=None, memory=memory
+                    )
+                )
+            elif isinstance(node.step, SimpleChain):
+                output = execute_simple_chain(
+                    SimpleChain.construct(prompt=node.step.prompt, callback=None, memory=memory)
+                )
+            else:
+                value = node.step(*inputs)
+                return value, value
+        except Exception as exc:
+            return _MISSING, {"error": f"{node.name} raised {exc!r}"}
+
+        if "error" in output:
+            return _MISSING, output
+        callback = resolve_callback(node.callback)
+        try:
+            result = callback(output) if callback else output
+        except Exception as exc:
+            return _MISSING, {"error": f"Callback failed: {exc}"}
+        return output["generated_code"], result
+
+
+# Examples:
+"""
+pipeline = (
+    Pipeline()
+    .add("outline", TemplateChain(template_prompt="Outline an article on {0}", inputs=["$topic"]))
+    .add("title", TemplateChain(template_prompt="Title for {0}", inputs=["$outline"]))
+    .add("draft", TemplateChain(template_prompt="Write {0} in a {1} tone", inputs=["$outline", "$tone"]))
+    .add("summary", lambda title, draft: f"{title}: {draft[:100]}", inputs=["$title", "$draft"])
+)
+results = pipeline.run(topic="caching", tone="casual")
+
+# Only draft and summary run again; outline and title come from the cache
+results = pipeline.run(topic="caching", tone="formal")
+"""
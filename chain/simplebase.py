@@ -1,14 +1,76 @@
 from pydantic import BaseModel, Field
-from typing import Callable, Dict, Union, Any, Optional
+from typing import AsyncIterator, Callable, Dict, List, Union, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
 import json
+import re
+
+from memory.llm_cache import ResponseCache, make_cache_key
+from tracing.tracer import tracer
 
 
 # Dummy Language Learning Model for demonstration
 class LLMSetup:
+    # Set to a ResponseCache to answer repeated prompts without the model
+    cache: Optional[ResponseCache] = None
+    model = "dummy"
+
+    @classmethod
+    def generate_prompt(cls, prompt: str, pre_context: Optional[str] = None) -> str:
+        if cls.cache is not None:
+            key = make_cache_key(
+                cls.model, [{"role": "user", "content": prompt}], pre_context=pre_context
+            )
+            return cls.cache.get_or_compute(
+                key, lambda: cls._generate_prompt(prompt, pre_context)
+            )
+        return cls._generate_prompt(prompt, pre_context)
+
     @staticmethod
-    def generate_prompt(prompt: str, pre_context: Optional[str] = None) -> str:
+    @tracer.traced("llm.call")
+    def _generate_prompt(prompt: str, pre_context: Optional[str] = None) -> str:
         return f"Answer the following for prompt: {prompt}. Pre-context: {pre_context}"
 
+    @classmethod
+    def generate_prompts(
+        cls,
+        prompts: List[str],
+        pre_contexts: List[Optional[str]],
+        max_workers: int = 8,
+    ) -> List[Any]:
+        """
+        Generate many prompts, concurrently when max_workers is above one
+        :param prompts:
+        :param pre_contexts:
+        :param max_workers:
+        :return: generated text per prompt, or the exception it raised
+        """
+
+        def generate(args):
+            try:
+                return cls.generate_prompt(*args)
+            except Exception as exc:
+                return exc
+
+        pairs = list(zip(prompts, pre_contexts))
+        if max_workers <= 1 or len(pairs) <= 1:
+            return [generate(pair) for pair in pairs]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pairs))) as pool:
+            return list(pool.map(generate, pairs))
+
+    @classmethod
+    async def stream_prompt(
+        cls, prompt: str, pre_context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the generated text as token deltas
+        :param prompt:
+        :param pre_context:
+        :return:
+        """
+        # The dummy model has the whole answer up front, so emit it word by word
+        for token in re.findall(r"\S+\s*", cls.generate_prompt(prompt, pre_context)):
+            yield token
+
 
 def to_json(data: Dict) -> str:
     return json.dumps(data)
@@ -27,6 +89,47 @@ callback_mapping = {
     "to_upper": to_upper,
 }
 
+# Callbacks that can also be applied to each streamed delta on its own
+stream_callback_mapping = {
+    "to_upper": str.upper,
+}
+
+
+def resolve_callback(callback: Optional[Union[Callable[[Dict], Any], str]]):
+    if isinstance(callback, str):
+        return callback_mapping.get(callback, to_json)
+    return callback
+
+
+async def stream_output(
+    prompt_key: str,
+    prompt: str,
+    memory: Optional[str],
+    callback: Optional[Union[Callable[[Dict], Any], str]],
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a chain's generated text, then its final output
+    :param prompt_key: name of the prompt in the output dict
+    :param prompt:
+    :param memory:
+    :param callback:
+    :return: {"delta": text} events followed by one {"output": result} event
+    """
+    transform = stream_callback_mapping.get(callback) if isinstance(callback, str) else None
+    parts = []
+    async for delta in LLMSetup.stream_prompt(prompt, memory):
+        parts.append(delta)
+        yield {"delta": transform(delta) if transform else delta}
+
+    output = {
+        prompt_key: prompt,
+        "generated_code": "".join(parts),
+    }
+    callback = resolve_callback(callback)
+    if callback:
+        output = callback(output)
+    yield {"output": output}
+
 
 # Pydantic Model for Chain without template
 class SimpleChain(BaseModel):
@@ -40,6 +143,7 @@ class SimpleChain(BaseModel):
 
 
 # Function to execute a simple chain
+@tracer.traced("chain.execute_simple_chain")
 def execute_simple_chain(simple_chain: SimpleChain) -> Any:
     """
     Execute a simple chain
@@ -54,16 +158,25 @@ def execute_simple_chain(simple_chain: SimpleChain) -> Any:
         "generated_code": generated_code,
     }
 
-    callback = simple_chain.callback
-    if isinstance(callback, str):
-        callback = callback_mapping.get(callback, to_json)
-
+    callback = resolve_callback(simple_chain.callback)
     if callback:
         output = callback(output)
 
     return output
 
 
+# Function to stream a simple chain
+def stream_simple_chain(simple_chain: SimpleChain) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a simple chain
+    :param simple_chain:
+    :return: async iterator of {"delta": text} events, then {"output": result}
+    """
+    return stream_output(
+        "prompt", simple_chain.prompt, simple_chain.memory, simple_chain.callback
+    )
+
+
 # Examples:
 
 
@@ -77,4 +190,8 @@ print(f"Example 1 - With Memory: {result1}")
 chain2 = SimpleChain(prompt="Hello World")
 result2 = execute_simple_chain(chain2)
 print(f"Example 2 - Without Memory: {result2}")
+
+# Example 3: Streaming, printing deltas as they arrive
+async for event in stream_simple_chain(chain1):
+    print(event.get("delta", ""), end="")
 """
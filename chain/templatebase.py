@@ -1,13 +1,77 @@
-from pydantic import BaseModel, Field
-from typing import List, Callable, Dict, Union, Any, Optional
+from pydantic import BaseModel, Field, root_validator
+from typing import AsyncIterator, List, Callable, Dict, Sequence, Tuple, Union, Any, Optional
+from functools import lru_cache
+from string import Formatter
 import json
 
-from chain.simplebase import LLMSetup, callback_mapping, to_json
+from tracing.tracer import tracer
 
 
 # Dummy Language Learning Model for demonstration
 
 
+class CompiledTemplate:
+    """
+    Template parsed once into literal segments and positional input slots
+    """
+
+    __slots__ = ("parts", "slots", "arity")
+
+    def __init__(self, parts: List[str], slots: List[Tuple[int, int, str, Optional[str]]]):
+        self.parts = parts  # Literal segments, with "" where each slot goes
+        self.slots = slots  # (part position, input index, format spec, conversion)
+        self.arity = max((slot[1] for slot in slots), default=-1) + 1
+
+    def render(self, inputs: Sequence[str]) -> str:
+        if len(inputs) < self.arity:
+            raise IndexError("Mismatch between placeholders and inputs.")
+        parts = self.parts.copy()
+        for position, index, spec, conversion in self.slots:
+            value = inputs[index]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "a":
+                value = ascii(value)
+            parts[position] = format(value, spec) if spec else str(value)
+        return "".join(parts)
+
+
+@lru_cache(maxsize=512)
+def compile_template(template_prompt: str) -> CompiledTemplate:
+    """
+    Parse a str.format template with positional placeholders, once per template
+    :param template_prompt:
+    :return:
+    """
+    parts: List[str] = []
+    slots = []
+    auto_index = 0
+    numbering = None
+    for literal, field_name, spec, conversion in Formatter().parse(template_prompt):
+        if literal:
+            parts.append(literal)
+        if field_name is None:
+            continue
+        if field_name == "":
+            if numbering == "manual":
+                raise ValueError("Cannot mix automatic and manual field numbering")
+            numbering = "auto"
+            index = auto_index
+            auto_index += 1
+        elif field_name.isdigit():
+            if numbering == "auto":
+                raise ValueError("Cannot mix automatic and manual field numbering")
+            numbering = "manual"
+            index = int(field_name)
+        else:
+            raise ValueError(f"Only positional placeholders are supported, got {{{field_name}}}")
+        if spec and "{" in spec:
+            raise ValueError("Nested placeholders in format specs are not supported")
+        slots.append((len(parts), index, spec, conversion))
+        parts.append("")
+    return CompiledTemplate(parts, slots)
+
+
 # Pydantic Model for Template Chain
 class TemplateChain(BaseModel):
     template_prompt: str
@@ -15,8 +79,43 @@ class TemplateChain(BaseModel):
     callback: Optional[Union[Callable[[Dict], Any], str]] = "to_json"
     memory: Optional[str] = None
 
+    @root_validator(skip_on_failure=True)
+    def check_placeholders(cls, values):
+        compiled = compile_template(values["template_prompt"])
+        if compiled.arity != len(values["inputs"]):
+            raise ValueError(
+                f"Template has {compiled.arity} placeholders but {len(values['inputs'])} inputs"
+            )
+        return values
+
+    @classmethod
+    def trusted(
+        cls,
+        template_prompt: str,
+        inputs: List[str],
+        callback: Optional[Union[Callable[[Dict], Any], str]] = "to_json",
+        memory: Optional[str] = None,
+    ) -> "TemplateChain":
+        """
+        Build a chain checking only the placeholder count, skipping field validation
+        :param template_prompt:
+        :param inputs:
+        :param callback:
+        :param memory:
+        :return:
+        """
+        compiled = compile_template(template_prompt)
+        if compiled.arity != len(inputs):
+            raise ValueError(
+                f"Template has {compiled.arity} placeholders but {len(inputs)} inputs"
+            )
+        return cls.construct(
+            template_prompt=template_prompt, inputs=inputs, callback=callback, memory=memory
+        )
+
 
 # Function to execute a chain
+@tracer.traced("chain.execute_chain")
 def execute_chain(template_chain: TemplateChain) -> Any:
     """
     Execute a chain
@@ -24,10 +123,15 @@ def execute_chain(template_chain: TemplateChain) -> Any:
     :return:
     """
     try:
-        built_prompt = template_chain.template_prompt.format(*template_chain.inputs)
+        built_prompt = compile_template(template_chain.template_prompt).render(
+            template_chain.inputs
+        )
     except IndexError:
         return {"error": "Mismatch between placeholders and inputs."}
 
+    # Deferred so compiling and validating templates does not load the LLM stack
+    from chain.simplebase import LLMSetup, resolve_callback
+
     agent = LLMSetup()
     generated_code = agent.generate_prompt(built_prompt, template_chain.memory)
 
@@ -36,16 +140,36 @@ def execute_chain(template_chain: TemplateChain) -> Any:
         "generated_code": generated_code,
     }
 
-    callback = template_chain.callback
-    if isinstance(callback, str):
-        callback = callback_mapping.get(callback, to_json)
-
+    callback = resolve_callback(template_chain.callback)
     if callback:
         output = callback(output)
 
     return output
 
 
+# Function to stream a chain
+async def stream_chain(template_chain: TemplateChain) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a chain
+    :param template_chain:
+    :return: async iterator of {"delta": text} events, then {"output": result}
+    """
+    try:
+        built_prompt = compile_template(template_chain.template_prompt).render(
+            template_chain.inputs
+        )
+    except IndexError:
+        yield {"output": {"error": "Mismatch between placeholders and inputs."}}
+        return
+
+    from chain.simplebase import stream_output
+
+    async for event in stream_output(
+        "built_prompt", built_prompt, template_chain.memory, template_chain.callback
+    ):
+        yield event
+
+
 # Examples:
 """
 # Example 1: With Memory (memory) and Context, and a string-based callback to convert to upper case
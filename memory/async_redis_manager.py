@@ -0,0 +1,226 @@
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from memory.codec import Codec
+from memory.redis_manager import (
+    DEFAULT_MAX_CONNECTIONS,
+    RedisManager,
+    _conversation_from_hash,
+    _conversations_from_fields,
+    _decode,
+    _missing_contexts,
+    _queue_context,
+    _queue_uploads,
+    _unpack,
+    _warn_upload,
+)
+from tracing.tracer import tracer
+
+if TYPE_CHECKING:
+    import redis.asyncio as aioredis
+
+# Async pools hold connections bound to the event loop that opened them, so
+# they should be created and used from the same loop.
+_pools: Dict[tuple, "aioredis.ConnectionPool"] = {}
+
+
+def get_async_connection_pool(
+    host: str,
+    port: int = 6379,
+    db: int = 0,
+    password: Optional[str] = None,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+) -> "aioredis.ConnectionPool":
+    """
+    Get the process-wide asyncio connection pool for a Redis server
+    :param host:
+    :param port:
+    :param db:
+    :param password:
+    :param max_connections: only used when the pool is first created
+    :return:
+    """
+    key = (host, port, db, password)
+    pool = _pools.get(key)
+    if pool is None:
+        import redis.asyncio as aioredis
+
+        pool = aioredis.ConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            password=password,
+            max_connections=max_connections,
+        )
+        _pools[key] = pool
+    return pool
+
+
+def connect_async_redis(
+    host: str,
+    port: int = 6379,
+    db: int = 0,
+    password: Optional[str] = None,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+) -> "aioredis.Redis":
+    """
+    Connect to Redis with an asyncio client on the shared pool
+    :param host:
+    :param port:
+    :param db:
+    :param password:
+    :param max_connections:
+    :return:
+    """
+    import redis.asyncio as aioredis
+
+    return aioredis.Redis(
+        connection_pool=get_async_connection_pool(
+            host, port, db, password, max_connections
+        )
+    )
+
+
+async def upload_to_redis_async(
+    r,
+    conversations: List[RedisManager],
+    pre_context: Optional[str],
+    transaction: bool = True,
+    index=None,
+    codec: Optional[Codec] = None,
+):
+    """
+    Upload a list of conversations to Redis in a single round trip.
+    Deprecated: the keys are conversation:{i} from 0, so every upload
+    overwrites the last one; use SessionStore.append_async
+    :param r:
+    :param conversations:
+    :param pre_context:
+    :param transaction:
+    :param index: optional VectorIndex to add the conversations to
+    :param codec: store encoded records and deduplicated pre_contexts
+    :return:
+    """
+    _warn_upload("upload_to_redis_async")
+    await _upload_many_async(r, [(conversations, pre_context)], transaction, index, codec)
+
+
+async def upload_many_to_redis_async(
+    r,
+    uploads: Iterable[Tuple[List[RedisManager], Optional[str]]],
+    transaction: bool = True,
+    index=None,
+    codec: Optional[Codec] = None,
+):
+    """
+    Upload several buffers of conversations to Redis in a single round trip.
+    Deprecated: the keys are conversation:{i} from 0, so every upload
+    overwrites the last one; use SessionStore.append_async
+    :param r:
+    :param uploads: (conversations, pre_context) pairs, numbered consecutively
+    :param transaction:
+    :param index: optional VectorIndex to add the conversations to
+    :param codec: store encoded records and deduplicated pre_contexts
+    :return:
+    """
+    _warn_upload("upload_many_to_redis_async")
+    await _upload_many_async(r, uploads, transaction, index, codec)
+
+
+@tracer.traced("redis.upload")
+async def _upload_many_async(
+    r,
+    uploads: Iterable[Tuple[List[RedisManager], Optional[str]]],
+    transaction: bool,
+    index,
+    codec: Optional[Codec],
+):
+    pipe = r.pipeline(transaction=transaction)
+    i, stored = _queue_uploads(pipe, uploads, codec, index)
+    if i:
+        await pipe.execute()
+    if stored:
+        index.add_conversations(stored)
+
+
+@tracer.traced("redis.fetch")
+async def fetch_from_redis_async(
+    r, conversation_id: str, codec: Optional[Codec] = None
+) -> Optional[RedisManager]:
+    """
+    Fetch a conversation from Redis
+    :param r:
+    :param conversation_id:
+    :param codec: the codec the conversation was uploaded with
+    :return:
+    """
+    if codec is not None:
+        return (await fetch_many_from_redis_async(r, [conversation_id], codec))[0]
+    return _conversation_from_hash(await r.hgetall(f"conversation:{conversation_id}"))
+
+
+@tracer.traced("redis.fetch_many")
+async def fetch_many_from_redis_async(
+    r, conversation_ids: Iterable[str], codec: Optional[Codec] = None
+) -> List[Optional[RedisManager]]:
+    """
+    Fetch several conversations from Redis in a single pipelined round trip,
+    plus one for any pre_contexts the codec has not cached yet
+    :param r:
+    :param conversation_ids:
+    :param codec: the codec the conversations were uploaded with
+    :return:
+    """
+    pipe = r.pipeline(transaction=False)
+    for conversation_id in conversation_ids:
+        pipe.hgetall(f"conversation:{conversation_id}")
+    if codec is None:
+        return [_conversation_from_hash(data) for data in await pipe.execute()]
+
+    unpacked = [_unpack(data, codec) for data in await pipe.execute()]
+    keys = _missing_contexts(codec, unpacked)
+    if not keys:
+        return _conversations_from_fields(codec, unpacked)
+    for key in keys:
+        _queue_context(pipe, key)
+    return _conversations_from_fields(codec, unpacked, keys, await pipe.execute())
+
+
+@tracer.traced("redis.query")
+async def query_redis_async(r, key: str) -> Optional[str]:
+    """
+    Query a plain string value from Redis
+    :param r:
+    :param key:
+    :return:
+    """
+    return _decode(await r.get(key))
+
+
+class AsyncRedisStore:
+    """
+    Async Redis Store class to bind the awaitable memory operations to one client
+    """
+
+    def __init__(self, client, codec: Optional[Codec] = None):
+        self.client = client
+        self.codec = codec
+
+    async def upload(self, conversations: List[RedisManager], pre_context: Optional[str]):
+        # Deprecated, see upload_to_redis_async
+        _warn_upload("AsyncRedisStore.upload")
+        return await _upload_many_async(
+            self.client, [(conversations, pre_context)], True, None, self.codec
+        )
+
+    async def fetch(self, conversation_id: str) -> Optional[RedisManager]:
+        return await fetch_from_redis_async(self.client, conversation_id, self.codec)
+
+    async def fetch_many(
+        self, conversation_ids: Iterable[str]
+    ) -> List[Optional[RedisManager]]:
+        return await fetch_many_from_redis_async(
+            self.client, conversation_ids, self.codec
+        )
+
+    async def query(self, key: str) -> Optional[str]:
+        return await query_redis_async(self.client, key)
@@ -1,9 +1,14 @@
-from pydantic import BaseModel, parse_raw_as
+import json
+import uuid
+from collections import deque
 from typing import List, Optional
 
 from pydantic import BaseModel, parse_raw_as
 
-from memory.redis_manager import upload_to_redis
+from memory.codec import Codec
+from memory.context_assembler import Summarizer, extractive_summary
+from memory.keyspace import HashRing, SessionStore
+from memory.write_behind import WriteBehindFlusher
 
 
 class Conversation(BaseModel):
@@ -13,43 +18,251 @@ class Conversation(BaseModel):
     reason: str
 
 
+class ConversationRecord:
+    """
+    Compact buffered conversation, rendered once when it is added
+    """
+
+    __slots__ = ("question", "answer", "agents", "reason", "memory")
+
+    def __init__(self, question: str, answer: str, agents: List[str], reason: str):
+        self.question = question
+        self.answer = answer
+        self.agents = agents
+        self.reason = reason
+        self.memory = f"Previous Q: {question}, Previous A: {answer}"
+
+
 class ConversationBuffer:
-    def __init__(self):
-        self.buffer = []
+    """
+    Fixed-capacity ring buffer of the most recent conversations
+
+    Conversations are appended to the buffer's session in a SessionStore
+    once flush_size of them are pending, but stay in the ring as context
+    until newer ones overwrite them. The rendered context window is kept up
+    to date as conversations are added.
+    Each flush folds the flushed conversations into a rolling summary. With
+    a WriteBehindFlusher both the summary and the upload happen on its
+    worker thread instead of in add_conversation.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        capacity: int = 5,
+        flush_size: int = 5,
+        context_size: int = 5,
+        separator: str = " | ",
+        summarizer: Optional[Summarizer] = None,
+        flusher: Optional[WriteBehindFlusher] = None,
+        codec: Optional[Codec] = None,
+        index=None,
+        tenant: str = "default",
+        session: Optional[str] = None,
+        store: Optional[SessionStore] = None,
+    ):
+        """
+        :param redis_client: used as a single-node SessionStore when no store
+            is given; with neither, conversations are kept in memory only
+        :param capacity: conversations kept in the ring
+        :param flush_size: pending conversations that trigger a flush
+        :param context_size: conversations rendered into the context window
+        :param separator:
+        :param summarizer:
+        :param flusher: optional WriteBehindFlusher to upload in the background
+        :param codec: optional Codec uploads to redis_client are encoded with
+        :param index: optional VectorIndex flushed conversations are added to,
+            for semantic recall
+        :param tenant:
+        :param session: the session flushes are stored under, a new one by default
+        :param store: where flushes are appended to the session's history
+        """
+        if not 0 < flush_size <= capacity or not 0 < context_size <= capacity:
+            raise ValueError("flush_size and context_size must be within capacity")
+        self.redis_client = redis_client
+        self.capacity = capacity
+        self.flush_size = flush_size
+        self.context_size = context_size
+        self.separator = separator
+        self._ring: List[Optional[ConversationRecord]] = [None] * capacity
+        self._start = 0  # Position of the oldest record
+        self._size = 0
+        self._pending = 0  # Newest records not yet flushed
+        self._context = ""
+        self._context_lengths = deque()  # Rendered lengths, newest first
+        self.summarizer = summarizer or extractive_summary
+        self.summary: Optional[str] = None
+        self.flusher = flusher
+        self.codec = codec
+        self.index = index
+        self.tenant = tenant
+        self.session = session or uuid.uuid4().hex
+        if store is None and redis_client is not None:
+            store = SessionStore(HashRing({"default": redis_client}), codec=codec)
+        self.store = store
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def buffer(self) -> List[ConversationRecord]:
+        """
+        Conversations waiting to be flushed, oldest first
+        """
+        return [self._ring[self._position(i)] for i in range(-self._pending, 0)]
+
+    def _position(self, index: int) -> int:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("conversation index out of range")
+        return (self._start + index) % self.capacity
 
     def get_memory_from_buffer(self, index: int) -> Optional[str]:
         conversation = self.get_conversation_from_buffer(index)
 
         if conversation:
-            return f"Previous Q: {conversation.question}, Previous A: {conversation.answer}"
+            return conversation.memory
         return None
 
-    def add_conversation(self, response_json_str: str):
-        # Deserialize JSON string to Conversation object
-        conversation = parse_raw_as(Conversation, response_json_str)
+    def get_context(self) -> str:
+        """
+        Rendered memories of the most recent conversations, newest first
+        :return:
+        """
+        return self._context
 
-        self.buffer.append(conversation)
-        if len(self.buffer) >= 5:
+    def add_conversation(self, response_json_str: str, trusted: bool = False):
+        """
+        Buffer a conversation, flushing once flush_size of them are pending.
+        With an asyncio Redis client, use add_conversation_async
+        :param response_json_str:
+        :param trusted: skip validation for JSON produced by our own code
+        :return:
+        """
+        if self._buffer(response_json_str, trusted):
             self.process_buffer()
 
+    async def add_conversation_async(self, response_json_str: str, trusted: bool = False):
+        """
+        Same as add_conversation, awaiting the flush
+        :param response_json_str:
+        :param trusted:
+        :return:
+        """
+        if self._buffer(response_json_str, trusted):
+            await self.process_buffer_async()
+
+    def _buffer(self, response_json_str: str, trusted: bool) -> bool:
+        # Whether a flush is due
+        if trusted:
+            data = json.loads(response_json_str)
+            record = ConversationRecord(
+                data["question"], data["answer"], data["agents"], data["reason"]
+            )
+        else:
+            # Deserialize JSON string to Conversation object
+            conversation = parse_raw_as(Conversation, response_json_str)
+            record = ConversationRecord(
+                conversation.question,
+                conversation.answer,
+                conversation.agents,
+                conversation.reason,
+            )
+
+        if self._size < self.capacity:
+            self._ring[(self._start + self._size) % self.capacity] = record
+            self._size += 1
+        else:
+            self._ring[self._start] = record  # Overwrite the oldest record
+            self._start = (self._start + 1) % self.capacity
+        self._pending = min(self._pending + 1, self.capacity)
+        self._update_context(record.memory)
+        return self._pending >= self.flush_size
+
+    def _update_context(self, memory: str):
+        if self._context:
+            self._context = memory + self.separator + self._context
+        else:
+            self._context = memory
+        self._context_lengths.appendleft(len(memory))
+
+        if len(self._context_lengths) > self.context_size:
+            dropped = self._context_lengths.pop()
+            self._context = self._context[: -(dropped + len(self.separator))]
+
     def process_buffer(self):
+        if self.flusher is not None:
+            conversations, self._pending = self.buffer, 0
+            self.flusher.submit(
+                self.tenant,
+                self.session,
+                conversations,
+                self.get_memory_from_buffer(-1),
+                lambda: self._fold_summary(conversations),
+            )
+            return
+
+        if self.store is not None and self.store.is_async:
+            raise TypeError(
+                "The store uses asyncio Redis clients, use add_conversation_async"
+            )
+
         # Summarize conversations
-        summary = self.summarize_conversations()
+        conversations = self.buffer
+        self.summary = self.summarize_conversations(conversations)
         memory = self.get_memory_from_buffer(-1)
 
         # Upload to Redis
-        upload_to_redis(self.buffer, memory)
+        if self.store is not None:
+            self.store.append(self.tenant, self.session, conversations, memory, self.index)
+        elif self.index is not None:  # Memory-only buffer, still recallable
+            self.index.add_conversations(conversations)
+
+        # Everything buffered so far has been flushed
+        self._pending = 0
+
+    async def process_buffer_async(self):
+        """
+        Same as process_buffer, awaiting the upload when the store uses asyncio
+        Redis clients
+        :return:
+        """
+        if self.flusher is not None:  # Submitting does not wait for Redis
+            self.process_buffer()
+            return
+
+        # Take the pending records before awaiting so new ones start a fresh batch
+        conversations, self._pending = self.buffer, 0
+        self.summary = self.summarize_conversations(conversations)
+        memory = self.get_memory_from_buffer(-1)
+
+        if self.store is not None and self.store.is_async:
+            await self.store.append_async(
+                self.tenant, self.session, conversations, memory, self.index
+            )
+        elif self.store is not None:
+            self.store.append(self.tenant, self.session, conversations, memory, self.index)
+        elif self.index is not None:
+            self.index.add_conversations(conversations)
 
-        # Clear the buffer
-        self.buffer.clear()
+    def _fold_summary(self, conversations: List[ConversationRecord]):
+        self.summary = self.summarize_conversations(conversations)
 
-    def get_conversation_from_buffer(self, index: int) -> Optional[Conversation]:
+    def get_conversation_from_buffer(self, index: int) -> Optional[ConversationRecord]:
         try:
-            return self.buffer[index]
+            return self._ring[self._position(index)]
         except IndexError:
             return None
 
-    def summarize_conversations(self):
-        # Your logic to summarize conversations
-        # post LLM integration
-        return "Summary"
+    def summarize_conversations(
+        self, conversations: Optional[List[ConversationRecord]] = None
+    ):
+        """
+        Fold conversations into the rolling summary, the pending ones by default
+        :param conversations:
+        :return: the updated summary
+        """
+        if conversations is None:
+            conversations = self.buffer
+        return self.summarizer(self.summary, conversations)
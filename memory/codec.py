@@ -0,0 +1,191 @@
+import hashlib
+import zlib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from memory.llm_cache import TTLCache
+
+# First byte of an encoded conversation, naming its layout
+_VARINT_LAYOUT = 1
+_MSGPACK_LAYOUT = 2
+
+# First byte of an encoded text
+_RAW = 0
+_ZLIB = 1
+
+# question, answer, reason, context key, agents
+Fields = Tuple[str, str, str, Optional[str], List[str]]
+
+
+def context_key(pre_context: str) -> str:
+    """
+    Content-addressed key a pre_context is stored under, once per distinct text
+    :param pre_context:
+    :return:
+    """
+    return "context:" + hashlib.sha256(pre_context.encode()).hexdigest()[:32]
+
+
+@lru_cache(maxsize=None)
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+def _write_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _write_bytes(out: bytearray, value: bytes):
+    _write_varint(out, len(value))
+    out += value
+
+
+def _read_bytes(data: bytes, pos: int) -> Tuple[bytes, int]:
+    length, pos = _read_varint(data, pos)
+    return data[pos : pos + length], pos + length
+
+
+class Codec(ABC):
+    """
+    Turns conversation fields and pre_context texts into bytes and back
+    """
+
+    @abstractmethod
+    def encode(self, fields: Fields) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, data: bytes) -> Fields:
+        ...
+
+    @abstractmethod
+    def encode_text(self, text: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode_text(self, data: bytes) -> str:
+        ...
+
+
+class BinaryCodec(Codec):
+    """
+    Binary Codec class for compact, length-prefixed conversation records
+
+    Records are packed with msgpack when it is installed and with an in-house
+    varint layout otherwise; either can be decoded later. Text fields longer
+    than compress_threshold bytes are zlib-compressed when that makes them
+    smaller. Decoded pre_contexts are cached by key, since they never change.
+    """
+
+    def __init__(
+        self,
+        compress_threshold: int = 512,
+        level: int = 6,
+        use_msgpack: Optional[bool] = None,
+        context_cache_size: int = 256,
+    ):
+        """
+        :param compress_threshold: bytes above which a text field is compressed
+        :param level: zlib compression level
+        :param use_msgpack: defaults to whether msgpack is installed
+        :param context_cache_size: decoded pre_contexts kept in memory
+        """
+        if use_msgpack is None:
+            use_msgpack = _msgpack() is not None
+        elif use_msgpack and _msgpack() is None:
+            raise ImportError("msgpack is not installed")
+        self.compress_threshold = compress_threshold
+        self.level = level
+        self.use_msgpack = use_msgpack
+        self.contexts = TTLCache(context_cache_size, ttl=None)
+
+    def _pack(self, text: str) -> Tuple[bytes, bool]:
+        raw = text.encode()
+        if len(raw) > self.compress_threshold:
+            compressed = zlib.compress(raw, self.level)
+            if len(compressed) < len(raw):
+                return compressed, True
+        return raw, False
+
+    def encode(self, fields: Fields) -> bytes:
+        question, answer, reason, key, agents = fields
+        flags = 0
+        texts = []
+        for bit, text in enumerate((question, answer, reason)):
+            packed, compressed = self._pack(text)
+            flags |= compressed << bit
+            texts.append(packed)
+        key = (key or "").encode()
+        agents = [agent.encode() for agent in agents]
+
+        if self.use_msgpack:
+            body = _msgpack().packb([flags, *texts, key, agents], use_bin_type=True)
+            return bytes((_MSGPACK_LAYOUT,)) + body
+
+        out = bytearray((_VARINT_LAYOUT, flags))
+        for value in (*texts, key):
+            _write_bytes(out, value)
+        _write_varint(out, len(agents))
+        for agent in agents:
+            _write_bytes(out, agent)
+        return bytes(out)
+
+    def decode(self, data: bytes) -> Fields:
+        if data[0] == _MSGPACK_LAYOUT:
+            msgpack = _msgpack()
+            if msgpack is None:
+                raise ImportError("msgpack is needed to decode this record")
+            flags, *texts, key, agents = msgpack.unpackb(data[1:], raw=True)
+        else:
+            flags, pos = data[1], 2
+            values = []
+            for _ in range(4):
+                value, pos = _read_bytes(data, pos)
+                values.append(value)
+            *texts, key = values
+            count, pos = _read_varint(data, pos)
+            agents = []
+            for _ in range(count):
+                agent, pos = _read_bytes(data, pos)
+                agents.append(agent)
+
+        question, answer, reason = (
+            (zlib.decompress(text) if flags >> bit & 1 else text).decode()
+            for bit, text in enumerate(texts)
+        )
+        return (
+            question,
+            answer,
+            reason,
+            key.decode() or None,
+            [agent.decode() for agent in agents],
+        )
+
+    def encode_text(self, text: str) -> bytes:
+        packed, compressed = self._pack(text)
+        return bytes((_ZLIB if compressed else _RAW,)) + packed
+
+    def decode_text(self, data: bytes) -> str:
+        if data[0] == _ZLIB:
+            return zlib.decompress(data[1:]).decode()
+        return data[1:].decode()
+
@@ -0,0 +1,138 @@
+import re
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+# Words and individual punctuation marks; close to what BPE tokenizers produce
+# for English text when tiktoken is not installed
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+class TokenCounter:
+    """
+    Token Counter class for a target model, exact when tiktoken is installed
+    and approximate otherwise
+    """
+
+    def __init__(self, model: str = "gpt-3.5-turbo"):
+        self.model = model
+        self.encoding = _encoding(model)
+
+    def __call__(self, text: str) -> int:
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return len(_TOKEN.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Keep the first max_tokens tokens of text
+        :param text:
+        :param max_tokens:
+        :return:
+        """
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text)
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        for i, match in enumerate(_TOKEN.finditer(text)):
+            if i == max_tokens:
+                return text[: match.start()].rstrip()
+        return text
+
+
+class ContextAssembler:
+    """
+    Context Assembler class to pack labelled context sections under a token budget
+
+    Sections are admitted in priority order, and the section that overflows is
+    cut down to the tokens left, so its text should lead with what matters most.
+    Admitted sections keep the order they were given in.
+    """
+
+    def __init__(
+        self,
+        budget: int = 1000,
+        counter: Optional[TokenCounter] = None,
+        separator: str = ", ",
+    ):
+        self.budget = budget
+        self.counter = counter or TokenCounter()
+        self.separator = separator
+
+    def assemble(self, sections: Sequence[Tuple[str, Optional[str], int]]) -> str:
+        """
+        Build the context string
+        :param sections: (label, text, priority) triples, higher priority first in
+            line for the budget; empty texts are skipped
+        :return:
+        """
+        remaining = self.budget
+        packed: List[Optional[str]] = [None] * len(sections)
+        order = sorted(range(len(sections)), key=lambda i: -sections[i][2])
+        for i in order:
+            label, text, _ = sections[i]
+            if not text or remaining <= 0:
+                continue
+            prefix = f"{label}: "
+            cost = self.counter(prefix) + self.counter(text)
+            if cost > remaining:
+                text = self.counter.truncate(text, remaining - self.counter(prefix))
+                if not text:
+                    continue
+                cost = remaining
+            packed[i] = prefix + text
+            remaining -= cost
+        return self.separator.join(part for part in packed if part)
+
+
+def extractive_summary(
+    previous: Optional[str],
+    conversations,
+    budget: int = 300,
+    counter: Optional[TokenCounter] = None,
+) -> str:
+    """
+    Fold new conversations into a running summary without an LLM. When the
+    summary is over budget its oldest lines are shortened, then dropped.
+    :param previous: summary so far
+    :param conversations: records with question and answer attributes
+    :param budget: tokens
+    :param counter:
+    :return:
+    """
+    counter = counter or TokenCounter()
+    lines = previous.split("\n") if previous else []
+    lines.extend(f"Q: {c.question} A: {c.answer}" for c in conversations)
+
+    sizes = [counter(line) for line in lines]
+    total = sum(sizes)
+    oldest = 0
+    while total > budget and oldest < len(lines) - 1:
+        if sizes[oldest] > 8:
+            shortened = counter.truncate(lines[oldest], sizes[oldest] // 2) + " …"
+        else:
+            shortened = None
+        new_size = counter(shortened) if shortened else 0
+        total -= sizes[oldest] - new_size
+        lines[oldest], sizes[oldest] = shortened, new_size
+        if shortened is None:
+            oldest += 1
+    if total > budget:
+        lines[-1] = counter.truncate(lines[-1], budget)
+    return "\n".join(line for line in lines[oldest:] if line)
+
+
+# Summarises (previous summary, new conversations) into an updated summary
+Summarizer = Callable[[Optional[str], list], str]
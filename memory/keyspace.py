@@ -0,0 +1,399 @@
+import bisect
+import hashlib
+import inspect
+import itertools
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from memory.codec import Codec
+from memory.redis_manager import RedisManager, _decode, _fetch_keys, _queue_uploads
+from tracing.tracer import tracer
+
+# Per node, every session on it scored by last activity, as "tenant:session"
+SESSIONS_KEY = "sessions"
+
+
+def session_tag(tenant: str, session: str) -> str:
+    """
+    Hash tag shared by every key of a session, so they land on one node
+    (and one slot, under Redis Cluster)
+    :param tenant: may not contain ":"
+    :param session:
+    :return:
+    """
+    if ":" in tenant:
+        raise ValueError(f"Tenant {tenant!r} may not contain ':'")
+    return f"{{{tenant}:{session}}}"
+
+
+def conversation_key(tenant: str, session: str, conversation_id: int) -> str:
+    return f"conversation:{session_tag(tenant, session)}:{conversation_id}"
+
+
+def sequence_key(tenant: str, session: str) -> str:
+    # Counter the next conversation ids are allocated from
+    return f"conversation:{session_tag(tenant, session)}:seq"
+
+
+def recency_key(tenant: str, session: str) -> str:
+    # Sorted set of conversation ids, scored by id: the order they were stored in
+    return f"conversation:{session_tag(tenant, session)}:recent"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Hash Ring class to spread sessions over Redis nodes by consistent hashing
+
+    Every node is placed on the ring at replicas points, so adding or removing
+    one only moves the sessions between it and its neighbours.
+    """
+
+    def __init__(self, nodes: Optional[Dict[str, Any]] = None, replicas: int = 100):
+        """
+        :param nodes: mapping of node name to Redis client
+        :param replicas: virtual points per node
+        """
+        self.replicas = replicas
+        self.nodes: Dict[str, Any] = {}
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for name, client in (nodes or {}).items():
+            self.add_node(name, client)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add_node(self, name: str, client):
+        if name in self.nodes:
+            raise ValueError(f"Node {name} is already on the ring")
+        self.nodes[name] = client
+        for replica in range(self.replicas):
+            point = _hash(f"{name}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, name)
+
+    def remove_node(self, name: str):
+        del self.nodes[name]
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != name]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def node_for(self, key: str) -> str:
+        """
+        Name of the node that owns key
+        :param key:
+        :return:
+        """
+        if not self._points:
+            raise LookupError("The hash ring has no nodes")
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+    def client_for(self, key: str):
+        return self.nodes[self.node_for(key)]
+
+
+class SessionStore:
+    """
+    Session Store class for per-tenant, per-session conversation history
+
+    Conversation ids come from a per-session counter, so flushes never
+    overwrite each other, and a sorted set indexes each session by recency.
+    Sessions are sharded over the ring's nodes. With a ttl, every key of a
+    session expires together, ttl seconds after its last write; with
+    max_conversations, only the newest ones are kept. With a codec, each
+    flush's pre_context is stored once, in the hash of its newest
+    conversation, so retention and deletion remove it with them.
+    """
+
+    def __init__(
+        self,
+        ring: HashRing,
+        ttl: Optional[int] = None,
+        max_conversations: Optional[int] = None,
+        codec: Optional[Codec] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        :param ring:
+        :param ttl: seconds a session is kept after its last write
+        :param max_conversations: conversations kept per session
+        :param codec: optional Codec conversations are stored with
+        :param clock:
+        """
+        self.ring = ring
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self.codec = codec
+        self.clock = clock
+
+    def client_for(self, tenant: str, session: str):
+        return self.ring.client_for(session_tag(tenant, session))
+
+    @property
+    def is_async(self) -> bool:
+        # Whether the nodes are asyncio clients, to be used with append_async
+        return any(
+            inspect.iscoroutinefunction(getattr(client, "execute_command", None))
+            for client in self.ring.nodes.values()
+        )
+
+    def node_for(self, tenant: str, session: str) -> str:
+        return self.ring.node_for(session_tag(tenant, session))
+
+    @tracer.traced("keyspace.append")
+    def append(
+        self,
+        tenant: str,
+        session: str,
+        conversations: List[RedisManager],
+        pre_context: Optional[str] = None,
+        index=None,
+    ) -> List[int]:
+        """
+        Store conversations at the end of a session's history
+        :param tenant:
+        :param session:
+        :param conversations:
+        :param pre_context:
+        :param index: optional VectorIndex to add the conversations to
+        :return: the ids given to the conversations
+        """
+        return self.append_many([(tenant, session, conversations, pre_context)], index)[0]
+
+    @tracer.traced("keyspace.append_many")
+    def append_many(
+        self,
+        flushes: Iterable[Tuple[str, str, List[RedisManager], Optional[str]]],
+        index=None,
+    ) -> List[List[int]]:
+        """
+        Store several flushes, of any sessions, in two round trips per node
+        :param flushes: (tenant, session, conversations, pre_context) tuples
+        :param index: optional VectorIndex to add the conversations to
+        :return: per flush, the ids given to its conversations
+        """
+        flushes = list(flushes)
+        by_node: Dict[str, List[int]] = {}
+        for position, (tenant, session, conversations, _) in enumerate(flushes):
+            if conversations:
+                by_node.setdefault(self.node_for(tenant, session), []).append(position)
+
+        ids: List[List[int]] = [[] for _ in flushes]
+        for node, positions in by_node.items():
+            r = self.ring.nodes[node]
+            pipe = r.pipeline(transaction=False)
+            for position in positions:
+                tenant, session, conversations, _ = flushes[position]
+                pipe.incrby(sequence_key(tenant, session), len(conversations))
+            lasts = pipe.execute()
+
+            pipe = r.pipeline(transaction=True)
+            now = self.clock()
+            for position, last in zip(positions, lasts):
+                tenant, session, conversations, pre_context = flushes[position]
+                ids[position] = list(range(last - len(conversations) + 1, last + 1))
+                self._queue_append(
+                    pipe, tenant, session, ids[position], conversations, pre_context, now
+                )
+            pipe.execute()
+
+        if index is not None:
+            index.add_conversations(
+                [conv for _, _, conversations, _ in flushes for conv in conversations]
+            )
+        return ids
+
+    @tracer.traced("keyspace.append")
+    async def append_async(
+        self,
+        tenant: str,
+        session: str,
+        conversations: List[RedisManager],
+        pre_context: Optional[str] = None,
+        index=None,
+    ) -> List[int]:
+        """
+        Same as append, on asyncio Redis clients
+        :param tenant:
+        :param session:
+        :param conversations:
+        :param pre_context:
+        :param index:
+        :return:
+        """
+        if not conversations:
+            return []
+        r = self.client_for(tenant, session)
+        last = await r.incrby(sequence_key(tenant, session), len(conversations))
+        ids = list(range(last - len(conversations) + 1, last + 1))
+
+        pipe = r.pipeline(transaction=True)
+        self._queue_append(
+            pipe, tenant, session, ids, conversations, pre_context, self.clock()
+        )
+        await pipe.execute()
+        if index is not None:
+            index.add_conversations(conversations)
+        return ids
+
+    def _queue_append(
+        self,
+        pipe,
+        tenant: str,
+        session: str,
+        ids: List[int],
+        conversations: List[RedisManager],
+        pre_context: Optional[str],
+        now: float,
+    ):
+        _queue_uploads(
+            pipe,
+            [(conversations, pre_context)],
+            self.codec,
+            None,
+            [conversation_key(tenant, session, i) for i in ids],
+            self.ttl,
+            scoped=True,
+        )
+        # Scored by id, as ids stored in one transaction share a timestamp
+        pipe.zadd(recency_key(tenant, session), {str(i): i for i in ids})
+        pipe.zadd(SESSIONS_KEY, {f"{tenant}:{session}": now})
+        self._queue_retention(pipe, tenant, session, ids, now)
+
+    def _queue_retention(self, pipe, tenant: str, session: str, ids: List[int], now: float):
+        if self.max_conversations is not None and ids[-1] > self.max_conversations:
+            # Ids are consecutive, so the ones these writes pushed out are known
+            # without reading the index back
+            newest_dropped = ids[-1] - self.max_conversations
+            oldest_dropped = max(1, newest_dropped - len(ids) + 1)
+            pipe.delete(
+                *(
+                    conversation_key(tenant, session, i)
+                    for i in range(oldest_dropped, newest_dropped + 1)
+                )
+            )
+            pipe.zremrangebyrank(
+                recency_key(tenant, session), 0, -self.max_conversations - 1
+            )
+        if self.ttl is not None:
+            pipe.expire(sequence_key(tenant, session), self.ttl)
+            pipe.expire(recency_key(tenant, session), self.ttl)
+            # The conversations written before these ones are kept as long as
+            # the index that lists them; expiring a missing key is a no-op
+            oldest = 1
+            if self.max_conversations is not None:
+                oldest = max(1, ids[-1] - self.max_conversations + 1)
+            for i in range(oldest, ids[0]):
+                pipe.expire(conversation_key(tenant, session, i), self.ttl)
+            pipe.zremrangebyscore(SESSIONS_KEY, "-inf", now - self.ttl)
+
+    def fetch(
+        self, tenant: str, session: str, conversation_ids: Iterable[int]
+    ) -> List[Optional[RedisManager]]:
+        """
+        Fetch conversations of a session by id
+        :param tenant:
+        :param session:
+        :param conversation_ids:
+        :return: conversations in the order of the ids, None for missing ones
+        """
+        return _fetch_keys(
+            self.client_for(tenant, session),
+            [conversation_key(tenant, session, i) for i in conversation_ids],
+            self.codec,
+        )
+
+    @tracer.traced("keyspace.recent")
+    def recent(self, tenant: str, session: str, count: int = 10) -> List[RedisManager]:
+        """
+        The most recent conversations of a session, newest first
+        :param tenant:
+        :param session:
+        :param count:
+        :return:
+        """
+        r = self.client_for(tenant, session)
+        ids = r.zrevrange(recency_key(tenant, session), 0, count - 1)
+        conversations = _fetch_keys(
+            r, [conversation_key(tenant, session, _decode(i)) for i in ids], self.codec
+        )
+        return [conv for conv in conversations if conv is not None]
+
+    def delete_session(self, tenant: str, session: str):
+        r = self.client_for(tenant, session)
+        ids = r.zrange(recency_key(tenant, session), 0, -1)
+        pipe = r.pipeline(transaction=True)
+        pipe.delete(
+            sequence_key(tenant, session),
+            recency_key(tenant, session),
+            *(conversation_key(tenant, session, _decode(i)) for i in ids),
+        )
+        pipe.zrem(SESSIONS_KEY, f"{tenant}:{session}")
+        pipe.execute()
+
+    def add_node(self, name: str, client) -> int:
+        """
+        Add a node to the ring and move the sessions it now owns onto it
+        :param name:
+        :param client:
+        :return: number of sessions moved
+        """
+        sources = dict(self.ring.nodes)
+        self.ring.add_node(name, client)
+        moved = 0
+        for source in sources.values():
+            for member, score in source.zrange(SESSIONS_KEY, 0, -1, withscores=True):
+                tenant, session = _decode(member).split(":", 1)
+                if self.ring.node_for(session_tag(tenant, session)) == name:
+                    self._move_session(tenant, session, score, source, client)
+                    moved += 1
+        tracer.count("keyspace.sessions_moved", moved)
+        return moved
+
+    def _move_session(self, tenant: str, session: str, active: float, source, target):
+        sequence = source.get(sequence_key(tenant, session))
+        entries: List[Tuple[bytes, float]] = source.zrange(
+            recency_key(tenant, session), 0, -1, withscores=True
+        )
+        ids = [_decode(i) for i, _ in entries]
+        keys = [conversation_key(tenant, session, i) for i in ids]
+        conversations = _fetch_keys(source, keys, self.codec)
+
+        # Copy onto the new owner first, then remove from the old one. Runs of
+        # conversations sharing a pre_context are uploaded together, so it is
+        # stored once per run, in the newest of them
+        pipe = target.pipeline(transaction=True)
+        present = [(key, conv) for key, conv in zip(keys, conversations) if conv]
+        runs = [
+            list(run)
+            for _, run in itertools.groupby(present, lambda item: item[1].pre_context)
+        ]
+        _queue_uploads(
+            pipe,
+            [([conv for _, conv in run], run[0][1].pre_context) for run in runs],
+            self.codec,
+            None,
+            [key for key, _ in present],
+            self.ttl,
+            scoped=True,
+        )
+        if sequence is not None:
+            pipe.set(sequence_key(tenant, session), sequence, ex=self.ttl)
+        if entries:
+            pipe.zadd(recency_key(tenant, session), {_decode(i): s for i, s in entries})
+            if self.ttl is not None:
+                pipe.expire(recency_key(tenant, session), self.ttl)
+        pipe.zadd(SESSIONS_KEY, {f"{tenant}:{session}": active})
+        pipe.execute()
+
+        pipe = source.pipeline(transaction=True)
+        pipe.delete(sequence_key(tenant, session), recency_key(tenant, session), *keys)
+        pipe.zrem(SESSIONS_KEY, f"{tenant}:{session}")
+        pipe.execute()
+
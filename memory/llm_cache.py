@@ -0,0 +1,246 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from tracing.tracer import tracer
+
+_MISSING = object()
+
+
+def make_cache_key(model: str, messages: List[Dict[str, Any]], **params) -> str:
+    """
+    Hash a request into a cache key that ignores dict ordering and whitespace
+    :param model:
+    :param messages:
+    :param params: sampling parameters such as temperature or max_tokens
+    :return:
+    """
+    normalised = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(normalised.encode()).hexdigest()
+
+
+def _size_of(value: Any) -> int:
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class TTLCache:
+    """
+    TTL Cache class, an in-memory LRU whose entries also expire with age
+
+    Entries are evicted least recently used first once either max_entries or
+    max_bytes is exceeded.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 3600,
+        max_bytes: Optional[int] = None,
+        size_of: Callable[[Any], int] = _size_of,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.clock = clock
+        self.bytes = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires, size = entry
+            if expires is not None and expires <= self.clock():
+                del self._entries[key]
+                self.bytes -= size
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else self.clock() + ttl
+        size = self.size_of(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (value, expires, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None
+                and self.bytes > self.max_bytes
+                and len(self._entries) > 1
+            ):
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            self.bytes -= entry[2]
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class SqliteCacheTier:
+    """
+    Sqlite Cache Tier class to persist JSON-serialisable responses on disk
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = 7 * 24 * 3600,
+        clock: Callable[[], float] = time.time,
+    ):
+        import sqlite3
+
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+        )
+        self._db.commit()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return default
+        value, expires = row
+        if expires is not None and expires <= self.clock():
+            self.delete(key)
+            return default
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else self.clock() + ttl
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires),
+            )
+            self._db.commit()
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM responses WHERE key = ?", (key,)
+            ).rowcount
+            self._db.commit()
+        return bool(deleted)
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM responses WHERE expires IS NOT NULL AND expires <= ?",
+                (self.clock(),),
+            ).rowcount
+            self._db.commit()
+        return deleted
+
+    def close(self):
+        self._db.close()
+
+
+class ResponseCache:
+    """
+    Response Cache class for LLM replies, an in-memory LRU over an optional
+    persistent tier, with hit and miss counters
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 3600,
+        max_bytes: Optional[int] = None,
+        disk: Optional[SqliteCacheTier] = None,
+    ):
+        self.memory = TTLCache(max_entries, ttl, max_bytes)
+        self.disk = disk
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "entries": len(self.memory),
+            "bytes": self.memory.bytes,
+        }
+
+    def get(self, key: str, default=None):
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            tracer.count("llm_cache.hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                self.disk_hits += 1
+                tracer.count("llm_cache.hits")
+                tracer.count("llm_cache.disk_hits")
+                self.memory.set(key, value)  # Promote to the memory tier
+                return value
+        self.misses += 1
+        tracer.count("llm_cache.misses")
+        return default
+
+    def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]):
+        """
+        Return the cached value for key, computing and storing it on a miss
+        :param key:
+        :param compute:
+        :return:
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
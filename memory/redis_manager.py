@@ -1,6 +1,62 @@
-import redis
+import threading
+import warnings
+
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from memory.codec import Codec, Fields, context_key
+from tracing.tracer import tracer
+
+# redis is imported when the first connection is made, not with this module
+if TYPE_CHECKING:
+    import redis
+
+DEFAULT_MAX_CONNECTIONS = 50
+
+# Hash field an encoded conversation is stored under when a codec is used
+PACKED_FIELD = "data"
+
+# Hash field of a session's conversation that holds its upload's pre_context
+CONTEXT_FIELD = "context"
+
+# Connection pools shared by every client built for the same server
+_pools: Dict[tuple, "redis.ConnectionPool"] = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(
+    host: str,
+    port: int = 6379,
+    db: int = 0,
+    password: Optional[str] = None,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+) -> "redis.ConnectionPool":
+    """
+    Get the process-wide connection pool for a Redis server, creating it once
+    :param host:
+    :param port:
+    :param db:
+    :param password:
+    :param max_connections: only used when the pool is first created
+    :return:
+    """
+    key = (host, port, db, password)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                import redis
+
+                pool = redis.ConnectionPool(
+                    host=host,
+                    port=port,
+                    db=db,
+                    password=password,
+                    max_connections=max_connections,
+                )
+                _pools[key] = pool
+    return pool
 
 
 class RedisManager(BaseModel):
@@ -17,37 +73,232 @@ class RedisManager(BaseModel):
     # Connect to a single, secured Redis instance as a function
     # of the environment variables.
 
-    def connect_redis(self: str, port: int, db: int, password: str):
+    def connect_redis(
+        self: str,
+        port: int,
+        db: int,
+        password: str,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    ):
         """
-        Connect to Redis
+        Connect to Redis through the shared connection pool
         :param self:
         :param port:
         :param db:
         :param password:
+        :param max_connections:
         :return:
         """
-        return redis.Redis(host=self, port=port, db=0, password=password)
+        import redis
+
+        return redis.Redis(
+            connection_pool=get_connection_pool(
+                self, port, db, password, max_connections
+            )
+        )
+
+
+def _conversation_mapping(conv: RedisManager, pre_context: Optional[str]) -> dict:
+    return {
+        "question": conv.question,
+        "answer": conv.answer,
+        "agents": ",".join(conv.agents),
+        "reason": conv.reason,
+        "pre_context": pre_context or "",
+    }
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _conversation_from_hash(data: dict) -> Optional[RedisManager]:
+    if not data:
+        return None
+    if PACKED_FIELD in data or PACKED_FIELD.encode() in data:
+        raise ValueError("Conversation was stored with a codec, fetch it with that codec")
+    data = {_decode(key): _decode(value) for key, value in data.items()}
+    agents = data.get("agents")
+    return RedisManager(
+        question=data.get("question"),
+        answer=data.get("answer"),
+        agents=agents.split(",") if agents else [],
+        reason=data.get("reason"),
+        pre_context=data.get("pre_context") or None,  # Retrieve the pre_context
+    )
+
+
+def _unpack(data: dict, codec: Codec) -> Optional[Fields]:
+    packed = data.get(PACKED_FIELD.encode(), data.get(PACKED_FIELD))
+    if packed is None:
+        return None
+    return codec.decode(packed)
+
+
+def _missing_contexts(codec: Codec, unpacked: List[Optional[Fields]]) -> List[str]:
+    keys = {fields[3] for fields in unpacked if fields is not None and fields[3]}
+    return [key for key in keys if codec.contexts.get(key) is None]
+
+
+def _conversations_from_fields(
+    codec: Codec,
+    unpacked: List[Optional[Fields]],
+    keys: List[str] = (),
+    values: list = (),
+) -> List[Optional[RedisManager]]:
+    for key, value in zip(keys, values):
+        if value is not None:
+            codec.contexts.set(key, codec.decode_text(value))
+    conversations = []
+    for fields in unpacked:
+        if fields is None:
+            conversations.append(None)
+            continue
+        question, answer, reason, key, agents = fields
+        # Encoded records were validated on the way in, so skip validation here
+        conversations.append(
+            RedisManager.construct(
+                question=question,
+                answer=answer,
+                agents=agents,
+                reason=reason,
+                pre_context=codec.contexts.get(key) if key else None,
+            )
+        )
+    return conversations
+
+
+def _queue_uploads(
+    pipe,
+    uploads: Iterable[Tuple[List[RedisManager], Optional[str]]],
+    codec: Optional[Codec],
+    index,
+    keys: Optional[Iterable[str]] = None,
+    ttl: Optional[int] = None,
+    scoped: bool = False,
+) -> Tuple[int, List[RedisManager]]:
+    # Conversations go to keys in order, conversation:{i} by default, and
+    # expire after ttl seconds if given. A scoped upload keeps its encoded
+    # pre_context in the hash of its last conversation, so the context is
+    # deleted with the conversations that refer to it
+    stored = []
+    written = set()
+    keys = iter(keys) if keys is not None else None
+    i = 0
+    for conversations, pre_context in uploads:
+        targets = [
+            next(keys) if keys is not None else f"conversation:{i + n}"
+            for n in range(len(conversations))
+        ]
+        ref = text = None
+        if codec is not None and pre_context:
+            ref = context_key(pre_context)
+            if scoped:
+                if targets:
+                    text = codec.encode_text(pre_context)
+                    ref = f"{targets[-1]}#{ref}"
+            elif ref not in written:
+                # Each distinct pre_context is written once, under its content hash
+                pipe.set(ref, codec.encode_text(pre_context), ex=ttl)
+                written.add(ref)
+        for n, (key, conv) in enumerate(zip(targets, conversations)):
+            if codec is None:
+                mapping = _conversation_mapping(conv, pre_context)
+            else:
+                fields = (conv.question, conv.answer, conv.reason, ref, conv.agents)
+                mapping = {PACKED_FIELD: codec.encode(fields)}
+                if text is not None and n == len(targets) - 1:
+                    mapping[CONTEXT_FIELD] = text
+            # HSET merges fields, so drop what an earlier upload left under the key
+            pipe.delete(key)
+            pipe.hset(key, mapping=mapping)
+            if ttl is not None:
+                pipe.expire(key, ttl)
+            i += 1
+            if index is not None:
+                stored.append(conv)
+    return i, stored
+
+
+def _queue_context(pipe, ref: str):
+    # A scoped reference is "<conversation key>#<content hash>"
+    key, scoped, _ = ref.partition("#")
+    if scoped:
+        pipe.hget(key, CONTEXT_FIELD)
+    else:
+        pipe.get(ref)
+
 
+def _warn_upload(name: str):
+    # The caller of the deprecated function is two frames up
+    warnings.warn(
+        f"{name} numbers conversations from 0 and overwrites earlier uploads, "
+        "use SessionStore.append instead",
+        DeprecationWarning,
+        stacklevel=3,
+    )
 
-def upload_to_redis(r, conversations: List[RedisManager], pre_context: Optional[str]):
+
+def upload_to_redis(
+    r,
+    conversations: List[RedisManager],
+    pre_context: Optional[str],
+    transaction: bool = True,
+    index=None,
+    codec: Optional[Codec] = None,
+):
     """
-    Upload a list of conversations to Redis
+    Upload a list of conversations to Redis in a single round trip.
+    Deprecated: the keys are conversation:{i} from 0, so every upload
+    overwrites the last one; use SessionStore.append
     :param r:
     :param conversations:
     :param pre_context:
+    :param transaction: wrap the writes in MULTI/EXEC
+    :param index: optional VectorIndex to add the conversations to
+    :param codec: store encoded records and deduplicated pre_contexts
     :return:
     """
-    for i, conv in enumerate(conversations):
-        r.hmset(
-            f"conversation:{i}",
-            {
-                "question": conv.question,
-                "answer": conv.answer,
-                "agents": ",".join(conv.agents),
-                "reason": conv.reason,
-                "pre_context": pre_context,
-            },
-        )
+    _warn_upload("upload_to_redis")
+    _upload_many(r, [(conversations, pre_context)], transaction, index, codec)
+
+
+def upload_many_to_redis(
+    r,
+    uploads: Iterable[Tuple[List[RedisManager], Optional[str]]],
+    transaction: bool = True,
+    index=None,
+    codec: Optional[Codec] = None,
+):
+    """
+    Upload several buffers of conversations to Redis in a single round trip.
+    Deprecated: the keys are conversation:{i} from 0, so every upload
+    overwrites the last one; use SessionStore.append_many
+    :param r:
+    :param uploads: (conversations, pre_context) pairs, numbered consecutively
+    :param transaction: wrap the writes in MULTI/EXEC
+    :param index: optional VectorIndex to add the conversations to
+    :param codec: store encoded records and deduplicated pre_contexts
+    :return:
+    """
+    _warn_upload("upload_many_to_redis")
+    _upload_many(r, uploads, transaction, index, codec)
+
+
+@tracer.traced("redis.upload")
+def _upload_many(
+    r,
+    uploads: Iterable[Tuple[List[RedisManager], Optional[str]]],
+    transaction: bool,
+    index,
+    codec: Optional[Codec],
+):
+    pipe = r.pipeline(transaction=transaction)
+    i, stored = _queue_uploads(pipe, uploads, codec, index)
+    if i:
+        pipe.execute()
+    if stored:
+        index.add_conversations(stored)
 
 
 def upload_to_other_db():
@@ -58,19 +309,89 @@ def upload_to_other_db():
     return None
 
 
-def fetch_from_redis(r, conversation_id: str) -> Optional[RedisManager]:
+@tracer.traced("redis.fetch")
+def fetch_from_redis(
+    r, conversation_id: str, codec: Optional[Codec] = None
+) -> Optional[RedisManager]:
     """
     Fetch a conversation from Redis
     :param r:
     :param conversation_id:
+    :param codec: the codec the conversation was uploaded with
     :return:
     """
-    data = r.hgetall(f"conversation:{conversation_id}")
-    if not data:
-        return RedisManager(
-            question=data.get("question").decode(),
-            answer=data.get("answer").decode(),
-            agents=data.get("agents").decode().split(","),
-            reason=data.get("reason").decode(),
-            pre_context=data.get("pre_context").decode(),  # Retrieve the pre_context
+    if codec is not None:
+        return fetch_many_from_redis(r, [conversation_id], codec)[0]
+    return _conversation_from_hash(r.hgetall(f"conversation:{conversation_id}"))
+
+
+@tracer.traced("redis.fetch_many")
+def fetch_many_from_redis(
+    r, conversation_ids: Iterable[str], codec: Optional[Codec] = None
+) -> List[Optional[RedisManager]]:
+    """
+    Fetch several conversations from Redis in a single pipelined round trip,
+    plus one for any pre_contexts the codec has not cached yet
+    :param r:
+    :param conversation_ids:
+    :param codec: the codec the conversations were uploaded with
+    :return: conversations in the order of the ids, None for missing ones
+    """
+    return _fetch_keys(
+        r, [f"conversation:{conversation_id}" for conversation_id in conversation_ids], codec
+    )
+
+
+def _fetch_keys(
+    r, keys: Iterable[str], codec: Optional[Codec]
+) -> List[Optional[RedisManager]]:
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+    if codec is None:
+        return [_conversation_from_hash(data) for data in pipe.execute()]
+
+    unpacked = [_unpack(data, codec) for data in pipe.execute()]
+    keys = _missing_contexts(codec, unpacked)
+    if not keys:
+        return _conversations_from_fields(codec, unpacked)
+    for key in keys:
+        _queue_context(pipe, key)
+    return _conversations_from_fields(codec, unpacked, keys, pipe.execute())
+
+
+@tracer.traced("redis.query")
+def query_redis(r, key: str) -> Optional[str]:
+    """
+    Query a plain string value from Redis
+    :param r:
+    :param key:
+    :return:
+    """
+    return _decode(r.get(key))
+
+
+class RedisStore:
+    """
+    Redis Store class to bind the memory operations to one client
+    """
+
+    def __init__(self, client, codec: Optional[Codec] = None):
+        self.client = client
+        self.codec = codec
+
+    def upload(self, conversations: List[RedisManager], pre_context: Optional[str]):
+        # Deprecated, see upload_to_redis
+        _warn_upload("RedisStore.upload")
+        return _upload_many(
+            self.client, [(conversations, pre_context)], True, None, self.codec
         )
+
+    def fetch(self, conversation_id: str) -> Optional[RedisManager]:
+        return fetch_from_redis(self.client, conversation_id, self.codec)
+
+    def fetch_many(self, conversation_ids: Iterable[str]) -> List[Optional[RedisManager]]:
+        return fetch_many_from_redis(self.client, conversation_ids, self.codec)
+
+    def query(self, key: str) -> Optional[str]:
+        return query_redis(self.client, key)
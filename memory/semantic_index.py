@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import TYPE_CHECKING, Callable, List, Optional, Sequence, Tuple
+
+# numpy is imported on first use so importing this module stays cheap
+if TYPE_CHECKING:
+    import numpy as np
+
+# Maps a batch of texts to a (len(texts), dim) array of embeddings
+EmbeddingFunction = Callable[[Sequence[str]], "np.ndarray"]
+
+_TOKEN = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Hashing Embedder class to embed text deterministically without a model
+
+    Tokens are hashed into a fixed number of signed buckets, which is enough
+    for tests and for a local stand-in for a real embedding model.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def __call__(self, texts: Sequence[str]) -> "np.ndarray":
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN.findall(text.lower()):
+                digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        return vectors
+
+
+def conversation_text(conversation) -> str:
+    return f"Previous Q: {conversation.question}, Previous A: {conversation.answer}"
+
+
+class VectorIndex:
+    """
+    Vector Index class for cosine top-k recall over stored conversations
+
+    Embeddings are normalised once on insert so a search is a single matrix
+    product. With a path, the vectors live in a memory-mapped .npy file and
+    the texts in a JSON side file, and both are reloaded on construction.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[EmbeddingFunction] = None,
+        dim: int = 256,
+        capacity: int = 1024,
+        path: Optional[str] = None,
+    ):
+        self.embed = embed or HashingEmbedder(dim)
+        self.dim = dim
+        self.path = path
+        self.texts: List[str] = []
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(self._vectors_path):
+            import numpy as np
+
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+            if os.path.exists(self._texts_path):
+                with open(self._texts_path) as f:
+                    self.texts = json.load(f)
+            if self._vectors.shape[1] != dim:
+                raise ValueError(
+                    f"Index at {path} has dimension {self._vectors.shape[1]}, not {dim}"
+                )
+        else:
+            self._vectors = self._allocate(max(capacity, 1))
+
+    @property
+    def _vectors_path(self) -> str:
+        return f"{self.path}.npy"
+
+    @property
+    def _texts_path(self) -> str:
+        return f"{self.path}.json"
+
+    def _allocate(self, capacity: int) -> "np.ndarray":
+        import numpy as np
+
+        if self.path:
+            return np.lib.format.open_memmap(
+                self._vectors_path,
+                mode="w+",
+                dtype=np.float32,
+                shape=(capacity, self.dim),
+            )
+        return np.zeros((capacity, self.dim), dtype=np.float32)
+
+    def _grow(self, needed: int):
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        old = self._vectors[: len(self.texts)].copy()
+        if self.path:
+            del self._vectors  # Release the old mapping before replacing the file
+        self._vectors = self._allocate(capacity)
+        self._vectors[: len(old)] = old
+
+    @staticmethod
+    def _normalise(vectors: "np.ndarray") -> "np.ndarray":
+        import numpy as np
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def add(self, texts: Sequence[str]):
+        """
+        Embed and add texts to the index
+        :param texts:
+        :return:
+        """
+        if not texts:
+            return
+        vectors = self._normalise(self.embed(list(texts)))
+        with self._lock:
+            start = len(self.texts)
+            self._grow(start + len(texts))
+            self._vectors[start : start + len(texts)] = vectors
+            self.texts.extend(texts)
+
+    def add_conversations(self, conversations):
+        self.add([conversation_text(conversation) for conversation in conversations])
+
+    def search_batch(
+        self, queries: Sequence[str], k: int = 5
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Find the k most similar stored texts for each query
+        :param queries:
+        :param k:
+        :return: per query, (text, cosine similarity) pairs best first
+        """
+        size = len(self.texts)
+        if not queries or size == 0 or k <= 0:
+            return [[] for _ in queries]
+        import numpy as np
+
+        k = min(k, size)
+        scores = self._normalise(self.embed(list(queries))) @ self._vectors[:size].T
+        if k < size:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(size), (len(queries), 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [
+            [(self.texts[i], float(score)) for i, score in zip(rows, row_scores)]
+            for rows, row_scores in zip(top, top_scores)
+        ]
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        return self.search_batch([query], k)[0]
+
+    def recall(self, query: str, k: int = 5) -> str:
+        """
+        Render the k most relevant stored conversations as context
+        :param query:
+        :param k:
+        :return:
+        """
+        return " | ".join(text for text, _ in self.search(query, k))
+
+    def flush(self):
+        """
+        Persist the index to its path, if it has one
+        :return:
+        """
+        if not self.path:
+            return
+        with self._lock:
+            self._vectors.flush()
+            with open(self._texts_path, "w") as f:
+                json.dump(self.texts, f)
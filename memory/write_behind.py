@@ -0,0 +1,268 @@
+import json
+import os
+import queue
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from memory.keyspace import SessionStore
+from memory.redis_manager import RedisManager
+from tracing.tracer import tracer
+
+_STOP = object()
+
+# (tenant, session, conversations, pre_context, callback run by the worker
+# before uploading)
+Flush = Tuple[str, str, list, Optional[str], Optional[Callable[[], None]]]
+
+
+class WriteBehindFlusher:
+    """
+    Write Behind Flusher class to take Redis uploads off the request path
+
+    Flushes go onto a bounded queue drained by a background thread, which
+    appends everything it finds waiting, across sessions, to a SessionStore
+    in one pipelined round trip per node. Failed uploads are retried with backoff. Flushes that still
+    fail, that do not fit the queue, or that are left over at shutdown are
+    appended to a local spill file, which is replayed on the next start.
+    """
+
+    def __init__(
+        self,
+        store: SessionStore,
+        max_pending: int = 1000,
+        batch_size: int = 50,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        put_timeout: Optional[float] = 1.0,
+        spill_path: Optional[str] = None,
+        index=None,
+    ):
+        """
+        :param store: where flushes are appended, each to its own session
+        :param max_pending: flushes queued before submit starts to block
+        :param batch_size: most flushes uploaded per round trip
+        :param max_retries:
+        :param backoff: seconds before the first retry, doubling each time
+        :param put_timeout: how long submit blocks on a full queue before
+            spilling (or raising queue.Full without a spill file); None blocks
+        :param spill_path:
+        :param index: optional VectorIndex uploads are added to
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.put_timeout = put_timeout
+        self.spill_path = spill_path
+        self.index = index
+        self.uploaded = 0
+        self.spilled = 0
+        self._queue: queue.Queue = queue.Queue(max_pending)
+        self._closing = threading.Event()
+        self._spill_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        Start the background worker, which first replays any spilled flushes
+        :return:
+        """
+        if self._thread is not None:
+            return
+        self._closing.clear()
+        self._thread = threading.Thread(
+            target=self._work, name="write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def submit(
+        self,
+        tenant: str,
+        session: str,
+        conversations: list,
+        pre_context: Optional[str],
+        callback: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Queue conversations for upload
+        :param tenant:
+        :param session:
+        :param conversations:
+        :param pre_context:
+        :param callback: run on the worker thread just before the upload
+        :return:
+        """
+        if self._closing.is_set():
+            raise RuntimeError("WriteBehindFlusher is closed")
+        flush = (tenant, session, list(conversations), pre_context, callback)
+        try:
+            self._queue.put(flush, timeout=self.put_timeout)
+        except queue.Full:
+            tracer.count("write_behind.backpressure")
+            if self.spill_path is None:
+                raise
+            self._spill([flush])
+
+    def close(self, timeout: Optional[float] = None):
+        """
+        Stop accepting flushes and drain the queue, spilling what is left
+        :param timeout: seconds to wait for the worker to drain
+        :return:
+        """
+        self._closing.set()
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+        leftover = []
+        while True:
+            try:
+                flush = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if flush is not _STOP:
+                leftover.append(flush)
+        if leftover:
+            self._spill(leftover)
+
+    def _work(self):
+        try:
+            self._replay()
+        except OSError:
+            tracer.count("write_behind.replay_errors")
+        while True:
+            flush = self._queue.get()
+            if flush is _STOP:
+                return
+            batch = [flush]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    flush = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if flush is _STOP:
+                    stop = True
+                    break
+                batch.append(flush)
+            self._upload(batch)
+            if stop:
+                return
+
+    def _upload(self, batch: List[Flush]) -> bool:
+        for *_, callback in batch:
+            if callback is not None:
+                try:
+                    callback()
+                except Exception:
+                    tracer.count("write_behind.callback_errors")
+
+        # Nodes are retried on their own, so one that is down does not make
+        # the others write their flushes twice
+        by_node: Dict[str, List[Flush]] = {}
+        for flush in batch:
+            by_node.setdefault(self.store.node_for(flush[0], flush[1]), []).append(flush)
+        uploaded = True
+        for flushes in by_node.values():
+            uploaded = self._upload_node(flushes) and uploaded
+        return uploaded
+
+    def _upload_node(self, flushes: List[Flush]) -> bool:
+        appends = [
+            (tenant, session, conversations, pre_context)
+            for tenant, session, conversations, pre_context, _ in flushes
+        ]
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.store.append_many(appends, self.index)
+                self.uploaded += len(flushes)
+                return True
+            except Exception:
+                tracer.count("write_behind.retries")
+                if attempt == self.max_retries or self._closing.wait(delay):
+                    break
+                delay *= 2
+        self._spill(flushes)
+        return False
+
+    def _spill(self, batch: List[Flush]):
+        if not batch:
+            return
+        if self.spill_path is None:
+            tracer.count("write_behind.dropped", len(batch))
+            return
+        lines = "".join(
+            json.dumps(
+                {
+                    "tenant": tenant,
+                    "session": session,
+                    "conversations": [
+                        {
+                            "question": c.question,
+                            "answer": c.answer,
+                            "agents": list(c.agents),
+                            "reason": c.reason,
+                        }
+                        for c in conversations
+                    ],
+                    "pre_context": pre_context,
+                }
+            )
+            + "\n"
+            for tenant, session, conversations, pre_context, _ in batch
+        )
+        with self._spill_lock, open(self.spill_path, "a") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.spilled += len(batch)
+        tracer.count("write_behind.spilled", len(batch))
+
+    def _replay(self):
+        # The spill file is moved aside and only removed once its flushes are
+        # uploaded or spilled again, so a crash while replaying loses nothing.
+        # A replay file left by such a crash is finished first.
+        if self.spill_path is None:
+            return
+        replay_path = self.spill_path + ".replay"
+        for _ in range(2):
+            with self._spill_lock:
+                if not os.path.exists(replay_path):
+                    if not os.path.exists(self.spill_path):
+                        return
+                    os.replace(self.spill_path, replay_path)
+            flushes = self._read_spill(replay_path)
+            for start in range(0, len(flushes), self.batch_size):
+                end = start + self.batch_size
+                if not self._upload(flushes[start:end]):
+                    # Redis is still down, keep the rest for the next start
+                    self._spill(flushes[end:])
+                    os.remove(replay_path)
+                    return
+            os.remove(replay_path)
+
+    @staticmethod
+    def _read_spill(path: str) -> List[Flush]:
+        flushes = []
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A line torn by a crash mid-write
+                conversations = [
+                    RedisManager(pre_context=None, **c) for c in record["conversations"]
+                ]
+                flushes.append(
+                    (
+                        record["tenant"],
+                        record["session"],
+                        conversations,
+                        record["pre_context"],
+                        None,
+                    )
+                )
+        return flushes
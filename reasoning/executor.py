@@ -0,0 +1,172 @@
+import asyncio
+from typing import Any, AsyncIterable, Collection, Dict, List, Optional, Set
+
+from tracing.tracer import tracer
+
+
+class TaskGraphExecutor:
+    """
+    Task Graph Executor class to run independent tasks concurrently
+
+    Every task is a dict with a ``name``, the ``function`` to call and an
+    optional ``agent`` (defaults to the task name), ``input`` and
+    ``depends_on`` list of earlier task names. A string input value of the
+    form ``"$task_name"`` is replaced with the output of that task.
+    """
+
+    def __init__(
+        self, agent_manager, max_concurrency: int = 8, timeout: Optional[float] = None
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.agent_manager = agent_manager
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout  # Per task, in seconds
+
+    @staticmethod
+    def validate(tasks: List[Dict[str, Any]]):
+        """
+        Check that task names are unique and only depend on earlier tasks
+        :param tasks:
+        :return:
+        """
+        seen = set()
+        for task in tasks:
+            TaskGraphExecutor._check(task, seen)
+
+    @staticmethod
+    def _check(task: Dict[str, Any], seen: Set[str], completed: Collection[str] = ()):
+        name = task.get("name")
+        if not name:
+            raise ValueError(f"Task {task} has no name")
+        if name in seen:
+            raise ValueError(f"Duplicate task name {name}")
+        for dependency in task.get("depends_on") or []:
+            if dependency not in seen and dependency not in completed:
+                raise ValueError(
+                    f"Task {name} depends on unknown or later task {dependency}"
+                )
+        seen.add(name)
+
+    async def run(
+        self, tasks: List[Dict[str, Any]], completed: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run the tasks, starting each one as soon as its dependencies are done
+        :param tasks:
+        :param completed: results of earlier batches, which tasks may depend on
+            and reference as "$name" inputs
+        :return: mapping of task name to result, in plan order; an invalid task
+            gets {"error": ...} and the rest of the batch still runs
+        """
+        completed = completed or {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results: Dict[str, Any] = dict(completed)
+        pending: Dict[str, asyncio.Task] = {}
+        names: List[str] = []
+        seen: Set[str] = set()
+
+        for task in tasks:
+            self._admit(task, seen, completed, names, pending, results, semaphore)
+
+        await asyncio.gather(*pending.values())
+        return {name: results[name] for name in names}
+
+    async def run_stream(self, tasks: AsyncIterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Run tasks as they arrive, e.g. from plan_parser.stream_tasks, so early
+        tasks execute while later ones are still being planned
+        :param tasks:
+        :return: mapping of task name to result, in arrival order
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results: Dict[str, Any] = {}
+        pending: Dict[str, asyncio.Task] = {}
+        names: List[str] = []
+        seen: Set[str] = set()
+
+        try:
+            async for task in tasks:
+                self._admit(task, seen, (), names, pending, results, semaphore)
+        finally:
+            await asyncio.gather(*pending.values())
+        return {name: results[name] for name in names}
+
+    def _admit(
+        self,
+        task: Dict[str, Any],
+        seen: Set[str],
+        completed: Collection[str],
+        names: List[str],
+        pending: Dict[str, asyncio.Task],
+        results: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+    ):
+        try:
+            self._check(task, seen, completed)
+        except ValueError as exc:
+            # Other tasks may already be running, so report and carry on
+            name = task.get("name")
+            if name and name not in seen:
+                seen.add(name)
+                results[name] = {"error": str(exc)}
+                names.append(name)
+            return
+        self._start(task, pending, results, semaphore)
+        names.append(task["name"])
+
+    def _start(
+        self,
+        task: Dict[str, Any],
+        pending: Dict[str, asyncio.Task],
+        results: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+    ):
+        dependencies = [
+            pending[name] for name in task.get("depends_on") or [] if name in pending
+        ]
+        pending[task["name"]] = asyncio.ensure_future(
+            self._run_task(task, dependencies, results, semaphore)
+        )
+
+    async def _run_task(
+        self,
+        task: Dict[str, Any],
+        dependencies: List[asyncio.Task],
+        results: Dict[str, Any],
+        semaphore: asyncio.Semaphore,
+    ):
+        if dependencies:
+            await asyncio.gather(*dependencies)
+
+        for dependency in task.get("depends_on") or []:
+            result = results.get(dependency)
+            if isinstance(result, dict) and "error" in result:
+                results[task["name"]] = {
+                    "error": f"Dependency {dependency} of {task['name']} failed"
+                }
+                return
+
+        input_data = self._resolve_input(task.get("input"), results)
+        async with semaphore:
+            with tracer.span("reasoning.task", task=task["name"]):
+                results[task["name"]] = await self._execute(
+                    task.get("agent") or task["name"], task.get("function"), input_data
+                )
+
+    async def _execute(self, agent_name: str, function_name: Optional[str], input_data):
+        try:
+            return await self.agent_manager.execute_function_async(
+                agent_name, function_name, input_data, timeout=self.timeout
+            )
+        except Exception as exc:  # A failing task must not cancel its siblings
+            return {"error": f"{agent_name}.{function_name} raised {exc!r}"}
+
+    def _resolve_input(self, value, results: Dict[str, Any]):
+        if isinstance(value, str) and value.startswith("$") and value[1:] in results:
+            return results[value[1:]]
+        if isinstance(value, dict):
+            return {key: self._resolve_input(item, results) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._resolve_input(item, results) for item in value]
+        return value
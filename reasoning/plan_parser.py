@@ -0,0 +1,127 @@
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from pydantic import BaseModel, Field, ValidationError, validator
+
+from tracing.tracer import tracer
+
+
+class Task(BaseModel):
+    """
+    Pydantic model for a planned task
+    """
+
+    name: str
+    function: str
+    agent: Optional[str] = None  # Defaults to the task name
+    input: Any = None
+    depends_on: List[str] = Field(default_factory=list)
+    priority: Optional[int] = None
+    # Relative, as a model cannot know the scheduler's clock; see TaskScheduler.push
+    timeout_s: Optional[float] = None
+
+    @validator("depends_on", pre=True)
+    def _listify(cls, value):
+        # Models often write a single dependency as a bare string
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [value]
+        return value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.dict(exclude_none=True)
+
+
+class TaskStreamParser:
+    """
+    Task Stream Parser class to pull task objects out of streamed LLM output
+
+    Feed it text as it arrives and it returns every JSON object that has been
+    closed since the last call, validated as a Task. Text around the objects,
+    such as the enclosing array, code fences or prose, is ignored, and so are
+    objects that are not valid JSON or not valid tasks.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._scanned = 0  # Characters of the buffer already scanned
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.invalid = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Scan more output
+        :param text:
+        :return: tasks completed by this text, in order
+        """
+        self._buffer += text
+        tasks = []
+        start = 0 if self._depth else None
+        i = self._scanned
+        buffer = self._buffer
+        while i < len(buffer):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                # Strings only matter inside an object; prose quotes are skipped
+                self._in_string = self._depth > 0
+            elif char == "{":
+                if self._depth == 0:
+                    start = i
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    task = self._parse(buffer[start : i + 1])
+                    if task is not None:
+                        tasks.append(task)
+                    start = None
+            i += 1
+
+        # Keep only the unfinished object, if any
+        self._buffer = buffer[start:] if start is not None else ""
+        self._scanned = len(self._buffer)
+        return tasks
+
+    def _parse(self, text: str) -> Optional[Dict[str, Any]]:
+        try:
+            return Task.parse_obj(json.loads(text)).to_dict()
+        except (ValueError, ValidationError):
+            self.invalid += 1
+            tracer.count("reasoning.invalid_tasks")
+            return None
+
+
+def parse_tasks(text: str) -> List[Dict[str, Any]]:
+    """
+    Parse every valid task in a complete LLM reply
+    :param text:
+    :return:
+    """
+    return TaskStreamParser().feed(text)
+
+
+async def stream_tasks(deltas: AsyncIterator[Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Yield tasks as soon as they are complete in a stream of text deltas
+    :param deltas: strings, or stream_chain events whose "delta" is parsed
+    :return:
+    """
+    parser = TaskStreamParser()
+    async for delta in deltas:
+        if isinstance(delta, dict):
+            delta = delta.get("delta")
+            if delta is None:  # The final {"output": ...} event
+                continue
+        for task in parser.feed(delta):
+            yield task
+
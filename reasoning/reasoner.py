@@ -1,6 +1,15 @@
+import inspect
 import os
+from typing import Optional
 
-from chain.templatebase import TemplateChain, execute_chain
+from chain.templatebase import TemplateChain, execute_chain, stream_chain
+from memory.context_assembler import ContextAssembler
+from reasoning.executor import TaskGraphExecutor
+from reasoning.plan_parser import parse_tasks, stream_tasks
+from reasoning.scheduler import URGENT_PRIORITY, TaskScheduler
+from tracing.tracer import tracer
+
+NO_TASKS = "No tasks available"
 
 
 class Reasoning:
@@ -8,63 +17,118 @@ class Reasoning:
     Reasoning class to represent a reasoning agent
     """
 
-    def __init__(self, agent_manager, memory_manager):
+    def __init__(
+        self,
+        agent_manager,
+        memory_manager,
+        max_concurrency: int = 8,
+        recall_k: int = 5,
+        context_budget: int = 1000,
+    ):
         self.agent_manager = agent_manager
         self.memory_manager = memory_manager
-        self.task_list = []  # To store the list of tasks
+        self.recall_k = recall_k  # Past conversations recalled per objective
+        self.context_assembler = ContextAssembler(context_budget)
+        self.task_list = TaskScheduler()  # To store the queued tasks
+        self.executor = TaskGraphExecutor(agent_manager, max_concurrency)
 
-    def interpret_objective(self, objective: str):
+    @tracer.traced("reasoning.interpret_objective")
+    def interpret_objective(self, objective: str, priority: Optional[int] = None):
         """
         Interpret an objective to generate tasks
         :param objective:
+        :param priority: queue priority of the generated tasks, lower runs first;
+            defaults to each task's own "priority"
         :return:
         """
-        # Query buffer memory to get all relevant context
-        buffer_memory_contexts = []
-        for i in range(-1, -6, -1):  # Loop through the last 5 conversations
-            context = self.memory_manager.buffer.get_memory_from_buffer(i)
-            if context:
-                buffer_memory_contexts.append(context)
-            else:
-                break
-
-        # Concatenate all buffer memory contexts
-        buffer_memory = " | ".join(buffer_memory_contexts)
-
-        # Query Redis to get any other relevant context
-        redis_memory = self.memory_manager.redis.query(
-            "some_key"
-        )  # Replace with your actual query
+        redis_memory = self._recall(objective)
+        if redis_memory is None:
+            redis_memory = self.memory_manager.redis.query(
+                "some_key"
+            )  # Replace with your actual query
+        self._plan_tasks(objective, self._build_pre_context(redis_memory), priority)
+
+    @tracer.traced("reasoning.interpret_objective")
+    async def interpret_objective_async(
+        self, objective: str, priority: Optional[int] = None
+    ):
+        """
+        Interpret an objective to generate tasks, awaiting the memory query
+        :param objective:
+        :param priority:
+        :return:
+        """
+        self._plan_tasks(objective, await self._pre_context_async(objective), priority)
 
-        pre_context = f"Buffer: {buffer_memory}, Redis: {redis_memory}"
+    @tracer.traced("reasoning.plan_and_execute")
+    async def plan_and_execute(self, objective: str, original_prompt=None):
+        """
+        Stream the plan for an objective and execute each task as soon as it
+        has been generated, while the rest of the plan is still streaming
+        :param objective:
+        :param original_prompt: what results are assessed against
+        :return: mapping of task name to result
+        """
+        task_chain = self._task_chain(objective, await self._pre_context_async(objective))
+        results = await self.executor.run_stream(stream_tasks(stream_chain(task_chain)))
+        for result in results.values():
+            assessment = self.assess_and_update(result, original_prompt or objective)
+            print(assessment)
+        return results
+
+    async def _pre_context_async(self, objective: str) -> str:
+        redis_memory = self._recall(objective)
+        if redis_memory is None:
+            redis_memory = self.memory_manager.redis.query(
+                "some_key"
+            )  # Replace with your actual query
+            if inspect.isawaitable(redis_memory):
+                redis_memory = await redis_memory
+        return self._build_pre_context(redis_memory)
+
+    def _recall(self, objective: str) -> Optional[str]:
+        # Prefer the conversations most relevant to the objective when the
+        # memory manager keeps a semantic index
+        index = getattr(self.memory_manager, "index", None)
+        if index is None:
+            index = getattr(self.memory_manager.buffer, "index", None)
+        if index is None:
+            return None
+        # Nothing recalled, e.g. an empty index, falls back to the Redis query
+        return index.recall(objective, self.recall_k) or None
+
+    def _build_pre_context(self, redis_memory) -> str:
+        # Recent turns first, then recalled memory, then the older history summary
+        buffer = self.memory_manager.buffer
+        return self.context_assembler.assemble(
+            [
+                ("Buffer", buffer.get_context(), 3),
+                ("Redis", redis_memory and str(redis_memory), 2),
+                ("Summary", getattr(buffer, "summary", None), 1),
+            ]
+        )
 
-        # Create a TemplateChain object
-        task_chain = TemplateChain(
+    @staticmethod
+    def _task_chain(objective: str, pre_context: str) -> TemplateChain:
+        return TemplateChain(
             template_prompt="Given the objective {0}, generate tasks. in following mapped JSON format: "
-            + "{{'name': 'task_name', 'function': 'function_to_use', 'input': 'input_to_add'}, "
-            + "{'name': 'task_name', 'function': 'function_to_use', 'input': 'input_to_add'}}",
+            + '[{{"name": "task_name", "agent": "agent_name", "function": "function_to_use", '
+            + '"input": "input_to_add", "depends_on": ["earlier_task_name"]}}, '
+            + '{{"name": "task_name", "agent": "agent_name", "function": "function_to_use", '
+            + '"input": "input_to_add", "depends_on": []}}]',
             inputs=[objective],
             memory=pre_context,
+            callback=None,  # Keep the raw reply for the plan parser
         )
 
+    def _plan_tasks(self, objective: str, pre_context: str, priority: Optional[int]):
         # Execute the chain to generate tasks
-        tasks = execute_chain(task_chain)
-        # for loop to go through the JSON formats and find the name and details.
-        # Then, append to the task_list
-        if not hasattr(self, "task_list") or self.task_list is None:
-            self.task_list = []
-
-        # Iterate over the JSON-formatted tasks to extract name and details
-        for task in tasks:
-            task_name = task.get("name")
-            task_details = task.get("details")
-            task_input = task.get("input")
-            if task_name and task_details:  # Ensure both are present
-                self.task_list.append(
-                    {"name": task_name, "details": task_details, "input": task_input}
-                )
-
-        self.task_list.extend(tasks)  # Store the generated tasks
+        output = execute_chain(self._task_chain(objective, pre_context))
+        if "error" in output:
+            return
+
+        # Only well-formed tasks are queued, see plan_parser.Task
+        self.task_list.extend(parse_tasks(output["generated_code"]), priority)
 
     def execute_first_task(self, input_data=None):
         """
@@ -72,18 +136,20 @@ class Reasoning:
         :param input_data:
         :return:
         """
-        if not self.task_list:
-            return "No tasks available"
-
-        first_task = self.task_list.pop(0)
+        first_task = self.task_list.pop()
+        if first_task is None:  # Empty, or every remaining task was stale
+            return NO_TASKS
 
-        task_name = first_task["name"]
-        task_details = first_task["function"]
-        task_input = first_task["input"]
+        agent_name = first_task.get("agent") or first_task["name"]
+        function_name = first_task["function"]
+        task_input = first_task.get("input")
 
-        result = self.agent_manager.execute_function(
-            task_name, input_data, **task_details
-        )
+        with tracer.span("reasoning.task", task=first_task["name"]):
+            result = self.agent_manager.execute_function(
+                agent_name,
+                function_name,
+                task_input if input_data is None else input_data,
+            )
 
         return result  # Return the result
 
@@ -110,14 +176,14 @@ class Reasoning:
 
         if should_update_tasks:
             print("Updating tasks based on assessment.")
-            # Logic to update the task list goes here
-            # For example, you can call self.interpret_objective with a new objective
+            # Re-planned tasks jump ahead of the rest of the queue
             self.interpret_objective(
-                "new_objective"
+                "new_objective", URGENT_PRIORITY
             )  # Replace 'new_objective' as needed
 
         return False
 
+    @tracer.traced("reasoning.objective")
     def run(self, original_prompt):
         """
         Run the reasoning agent
@@ -126,5 +192,23 @@ class Reasoning:
         """
         while self.task_list:
             result = self.execute_first_task()
+            if result == NO_TASKS:
+                break
             assessment = self.assess_and_update(result, original_prompt)
             print(assessment)
+
+    @tracer.traced("reasoning.objective")
+    async def run_concurrently(self, original_prompt):
+        """
+        Run the reasoning agent, executing independent tasks at the same time
+        :param original_prompt:
+        :return:
+        """
+        completed = {}  # Re-planned tasks may depend on tasks of earlier batches
+        while self.task_list:
+            tasks = self.task_list.drain()
+            results = await self.executor.run(tasks, completed)
+            completed.update(results)
+            for result in results.values():
+                assessment = self.assess_and_update(result, original_prompt)
+                print(assessment)
@@ -0,0 +1,147 @@
+import heapq
+import itertools
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Lower numbers run first
+URGENT_PRIORITY = 0
+DEFAULT_PRIORITY = 10
+
+_CANCELLED = object()
+
+
+class TaskScheduler:
+    """
+    Task Scheduler class to order tasks by priority and deadline
+
+    Tasks are kept in a heap ordered by (priority, deadline, insertion order).
+    Cancelled and expired tasks are left in the heap and skipped when they
+    reach the top, so neither operation has to rescan the queue.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._heap: List[list] = []
+        self._entries: Dict[int, list] = {}
+        self._ids = itertools.count()
+
+    def push(
+        self,
+        task: Dict[str, Any],
+        priority: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> int:
+        """
+        Add a task to the queue
+        :param task:
+        :param priority: defaults to the task's "priority" or DEFAULT_PRIORITY
+        :param deadline: absolute clock time after which the task is dropped;
+            defaults to the task's "deadline", or to now plus its "timeout_s"
+        :return: the task id, usable with cancel
+        """
+        if priority is None:
+            priority = task.get("priority", DEFAULT_PRIORITY)
+        if deadline is None:
+            deadline = task.get("deadline")
+        if deadline is None and task.get("timeout_s") is not None:
+            deadline = self.clock() + task["timeout_s"]
+        task_id = next(self._ids)
+        sort_deadline = float("inf") if deadline is None else deadline
+        entry = [priority, sort_deadline, task_id, deadline, task]
+        self._entries[task_id] = entry
+        heapq.heappush(self._heap, entry)
+        return task_id
+
+    def append(self, task: Dict[str, Any]) -> int:
+        return self.push(task)
+
+    def extend(self, tasks: Iterable[Dict[str, Any]], priority: Optional[int] = None):
+        for task in tasks:
+            self.push(task, priority)
+
+    def cancel(self, task_id: int) -> bool:
+        """
+        Cancel a queued task
+        :param task_id:
+        :return: whether the task was still queued
+        """
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return False
+        entry[-1] = _CANCELLED
+        return True
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        """
+        Remove and return the most urgent live task
+        :return: the task, or None if the queue is empty
+        """
+        now = None
+        while self._heap:
+            _, _, task_id, deadline, task = heapq.heappop(self._heap)
+            if task is _CANCELLED:
+                continue
+            del self._entries[task_id]
+            if deadline is not None:
+                if now is None:
+                    now = self.clock()
+                if deadline < now:
+                    continue
+            return task
+        return None
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """
+        Remove and return every live task in scheduling order, except that a
+        task never comes before the tasks of the batch it depends on
+        :return:
+        """
+        tasks = []
+        task = self.pop()
+        while task is not None:
+            tasks.append(task)
+            task = self.pop()
+        return _dependencies_first(tasks)
+
+    def clear(self):
+        self._heap.clear()
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        # Expired tasks still count until they are popped
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+
+def _dependencies_first(tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Stable topological sort: of the tasks whose dependencies are placed, the
+    # one earliest in scheduling order goes next. An urgent task that depends
+    # on a less urgent one thus waits for it instead of being rejected.
+    positions = {}
+    for position, task in enumerate(tasks):
+        positions.setdefault(task.get("name"), position)
+    waiting = [0] * len(tasks)
+    dependents: Dict[int, List[int]] = {}
+    for position, task in enumerate(tasks):
+        for dependency in set(task.get("depends_on") or []):
+            before = positions.get(dependency)
+            if before is not None and before != position:
+                waiting[position] += 1
+                dependents.setdefault(before, []).append(position)
+
+    ready = [position for position, count in enumerate(waiting) if count == 0]
+    heapq.heapify(ready)
+    ordered = []
+    while ready:
+        position = heapq.heappop(ready)
+        ordered.append(position)
+        for dependent in dependents.get(position, ()):
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                heapq.heappush(ready, dependent)
+    # Tasks in a cycle keep their order; the executor reports them
+    placed = set(ordered)
+    ordered.extend(p for p in range(len(tasks)) if p not in placed)
+    return [tasks[position] for position in ordered]
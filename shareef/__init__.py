@@ -0,0 +1,60 @@
+"""
+Entry point to the shareefai handlers.
+
+    import shareef
+
+    buffer = shareef.ConversationBuffer(redis_client)
+
+Names are imported from their modules on first access, so importing the
+package itself loads nothing else and workers only pay for what they use.
+"""
+import importlib
+
+_EXPORTS = {
+    "AgentManager": "agents.agent_manager",
+    "DynamicAgent": "agents.agent_manager",
+    "Assignment": "agents.async_manager",
+    "AssignmentScheduler": "agents.assignment_scheduler",
+    "EventBus": "agents.events",
+    "ResultCache": "agents.result_cache",
+    "RedisEventSource": "agents.events",
+    "SimpleChain": "chain.simplebase",
+    "execute_simple_chain": "chain.simplebase",
+    "stream_simple_chain": "chain.simplebase",
+    "TemplateChain": "chain.templatebase",
+    "execute_chain": "chain.templatebase",
+    "stream_chain": "chain.templatebase",
+    "execute_template_batch": "chain.batch",
+    "Pipeline": "chain.pipeline",
+    "ConversationBuffer": "memory.buffer_manager",
+    "WriteBehindFlusher": "memory.write_behind",
+    "BinaryCodec": "memory.codec",
+    "HashRing": "memory.keyspace",
+    "SessionStore": "memory.keyspace",
+    "ContextAssembler": "memory.context_assembler",
+    "ResponseCache": "memory.llm_cache",
+    "RedisManager": "memory.redis_manager",
+    "RedisStore": "memory.redis_manager",
+    "AsyncRedisStore": "memory.async_redis_manager",
+    "connect_async_redis": "memory.async_redis_manager",
+    "VectorIndex": "memory.semantic_index",
+    "Reasoning": "reasoning.reasoner",
+    "TaskGraphExecutor": "reasoning.executor",
+    "TaskScheduler": "reasoning.scheduler",
+    "tracer": "tracing.tracer",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
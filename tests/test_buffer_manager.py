@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+import pytest
+
+from memory.buffer_manager import ConversationBuffer
+
+fakeredis = pytest.importorskip("fakeredis")
+from fakeredis import aioredis  # noqa: E402
+
+
+def _conversation(i: int) -> str:
+    return json.dumps(
+        {"question": f"q{i}", "answer": f"a{i}", "agents": ["Agent"], "reason": "r"}
+    )
+
+
+def test_add_conversation_async_flushes_to_an_async_client():
+    async def scenario():
+        buffer = ConversationBuffer(aioredis.FakeRedis(), session="s")
+        for i in range(7):
+            await buffer.add_conversation_async(_conversation(i))
+        return buffer, await buffer.store.ring.client_for("{default:s}").keys("*")
+
+    buffer, keys = asyncio.run(scenario())
+    assert len(buffer.buffer) == 2
+    assert {f"conversation:{{default:s}}:{i}".encode() for i in range(1, 6)} <= set(keys)
+    assert buffer.summary
+
+
+def test_add_conversation_rejects_an_async_client():
+    async def scenario():
+        buffer = ConversationBuffer(aioredis.FakeRedis(), flush_size=1)
+        with pytest.raises(TypeError):
+            buffer.add_conversation(_conversation(0))
+
+    asyncio.run(scenario())
+
+
+def test_add_conversation_async_works_with_a_sync_client():
+    client = fakeredis.FakeRedis()
+    buffer = ConversationBuffer(client, session="s")
+
+    async def scenario():
+        for i in range(5):
+            await buffer.add_conversation_async(_conversation(i))
+
+    asyncio.run(scenario())
+    assert [c.question for c in buffer.store.recent("default", "s")] == [
+        f"q{i}" for i in reversed(range(5))
+    ]
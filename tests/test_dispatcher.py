@@ -0,0 +1,95 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeLLM
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "ai-handler"))
+
+from dispatcher import LLMDispatcher, TokenBucket  # noqa: E402
+
+
+def test_identical_requests_are_coalesced():
+    async def scenario():
+        llm = FakeLLM(latency=0.05)
+        dispatcher = LLMDispatcher(llm)
+        replies = await asyncio.gather(*(dispatcher.submit("same") for _ in range(5)))
+        other = await dispatcher.submit("other")
+        return llm, dispatcher, replies, other
+
+    llm, dispatcher, replies, other = asyncio.run(scenario())
+    assert llm.calls == ["same", "other"]
+    assert all(reply == replies[0] for reply in replies)
+    assert other["request"] == "other"
+    assert dispatcher.stats["coalesced"] == 4
+
+
+def test_token_bucket_paces_requests():
+    async def scenario():
+        bucket = TokenBucket(per_minute=600, capacity=1)  # One every 0.1s
+        start = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.28
+
+
+def test_dispatcher_is_paced_by_its_request_bucket():
+    async def scenario():
+        dispatcher = LLMDispatcher(FakeLLM())
+        dispatcher.request_bucket = TokenBucket(per_minute=600, capacity=1)
+        start = time.monotonic()
+        await dispatcher.submit_many([f"prompt {i}" for i in range(4)])
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.28
+
+
+def test_failures_are_retried_with_backoff():
+    async def scenario():
+        llm = FakeLLM(failures=2)
+        dispatcher = LLMDispatcher(llm, max_retries=3, backoff_base=0.01)
+        return llm, dispatcher, await dispatcher.submit("prompt")
+
+    llm, dispatcher, reply = asyncio.run(scenario())
+    assert reply["call"] == 2
+    assert len(llm.calls) == 3
+    assert dispatcher.stats["retries"] == 2
+    assert dispatcher.stats["failures"] == 0
+
+
+def test_retries_give_up_after_max_retries():
+    async def scenario():
+        dispatcher = LLMDispatcher(FakeLLM(failures=10), max_retries=2, backoff_base=0.01)
+        with pytest.raises(ConnectionError):
+            await dispatcher.submit("prompt")
+        return dispatcher
+
+    dispatcher = asyncio.run(scenario())
+    assert dispatcher.stats["attempts"] == 3
+    assert dispatcher.stats["failures"] == 1
+
+
+def test_backoff_is_bounded():
+    dispatcher = LLMDispatcher(FakeLLM(), backoff_base=0.5, backoff_max=2.0)
+    for attempt in range(8):
+        assert 0 <= dispatcher._backoff(attempt) <= min(2.0, 0.5 * 2**attempt)
+
+
+def test_slow_attempt_is_hedged():
+    async def scenario():
+        llm = FakeLLM(latencies=[1.0, 0.01])
+        dispatcher = LLMDispatcher(llm, hedge_after=0.05)
+        start = time.monotonic()
+        reply = await dispatcher.submit("prompt")
+        return llm, dispatcher, reply, time.monotonic() - start
+
+    llm, dispatcher, reply, elapsed = asyncio.run(scenario())
+    assert reply["call"] == 1  # The hedge answered first
+    assert elapsed < 0.5
+    assert len(llm.calls) == 2
+    assert dispatcher.stats["hedges"] == 1
@@ -0,0 +1,99 @@
+import asyncio
+
+from agents.agent_manager import AgentManager, DynamicAgent
+from agents.async_manager import Assignment
+from agents.backends import INLINE
+from agents.events import RedisEventSource
+from benchmarks.fakes import FakeAsyncRedis
+
+
+def _assignment(checks: list) -> Assignment:
+    def check(input_data=None):
+        checks.append(input_data)
+        return {"result": len(checks)}
+
+    manager = AgentManager(default_backend=INLINE)
+    manager.register_agent(DynamicAgent("Watcher", "Watches", "JSON", {"check": check}))
+    return Assignment("Watch", "Watch the room", manager, "Watcher", "check")
+
+
+def test_subscribe_and_deliver():
+    async def scenario():
+        source = RedisEventSource(FakeAsyncRedis())
+        subscription = await source.subscribe("room:*")
+        assert await source.publish("room:entrance", "open") == 1
+        assert await source.publish("hall:entrance", "open") == 0
+        event = await subscription.get(timeout=1)
+        assert event == {"topic": "room:entrance", "data": "open"}
+        await subscription.close()
+
+    asyncio.run(scenario())
+
+
+def test_get_times_out_without_events():
+    async def scenario():
+        source = RedisEventSource(FakeAsyncRedis())
+        subscription = await source.subscribe("room:*")
+        assert await subscription.get(timeout=0.05) is None
+        await subscription.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_unsubscribes():
+    async def scenario():
+        client = FakeAsyncRedis()
+        source = RedisEventSource(client)
+        subscription = await source.subscribe("room:*")
+        await subscription.close()
+        assert subscription.pubsub.closed
+        assert await source.publish("room:entrance", "open") == 0
+
+    asyncio.run(scenario())
+
+
+def test_listen_checks_on_event():
+    async def scenario():
+        checks, actions = [], []
+        client = FakeAsyncRedis()
+        source = RedisEventSource(client)
+        assignment = _assignment(checks)
+        listening = asyncio.create_task(
+            assignment.listen(
+                source,
+                "room:*",
+                lambda result: result["result"] == 2,
+                lambda: actions.append("done"),
+            )
+        )
+        while not client.pubsubs:
+            await asyncio.sleep(0)
+        await source.publish("room:entrance", "open")
+        await source.publish("room:entrance", "open")
+        await asyncio.wait_for(listening, 1)
+        assert len(checks) == 2
+        assert actions == ["done"]
+        assert not client.pubsubs  # The subscription is closed when it stops
+
+    asyncio.run(scenario())
+
+
+def test_listen_falls_back_to_polling():
+    async def scenario():
+        checks, actions = [], []
+        source = RedisEventSource(FakeAsyncRedis())
+        assignment = _assignment(checks)
+        await asyncio.wait_for(
+            assignment.listen(
+                source,
+                "room:*",
+                lambda result: True,
+                lambda: actions.append("done"),
+                fallback_interval=0.05,
+            ),
+            1,
+        )
+        assert len(checks) == 1
+        assert actions == ["done"]
+
+    asyncio.run(scenario())
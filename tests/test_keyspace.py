@@ -0,0 +1,137 @@
+from benchmarks.fakes import FakeRedis
+from memory.codec import BinaryCodec
+from memory.keyspace import (
+    SESSIONS_KEY,
+    HashRing,
+    SessionStore,
+    conversation_key,
+    recency_key,
+    sequence_key,
+)
+from memory.redis_manager import RedisManager
+
+
+def _conversation(i: int, pre_context=None) -> RedisManager:
+    return RedisManager(
+        question=f"q{i}",
+        answer=f"a{i}",
+        agents=["Agent"],
+        reason="r",
+        pre_context=pre_context,
+    )
+
+
+def _store(nodes: int = 1, **kwargs) -> SessionStore:
+    ring = HashRing({f"node{n}": FakeRedis() for n in range(nodes)})
+    return SessionStore(ring, **kwargs)
+
+
+def _session_keys(client, tenant: str, session: str) -> set:
+    tag = f"{{{tenant}:{session}}}"
+    return {name for name in client.data if tag in name}
+
+
+def test_append_numbers_conversations_per_session():
+    store = _store()
+    assert store.append("t", "a", [_conversation(0), _conversation(1)]) == [1, 2]
+    assert store.append("t", "b", [_conversation(2)]) == [1]
+    assert store.append("t", "a", [_conversation(3)]) == [3]
+    assert [c.question for c in store.recent("t", "a")] == ["q3", "q1", "q0"]
+    assert [c.question for c in store.recent("t", "b")] == ["q2"]
+
+
+def test_sessions_are_sharded_by_session():
+    store = _store(nodes=4)
+    sessions = [f"s{i}" for i in range(40)]
+    for session in sessions:
+        store.append("t", session, [_conversation(0)])
+
+    used = set()
+    for session in sessions:
+        owner = store.ring.nodes[store.node_for("t", session)]
+        used.add(store.node_for("t", session))
+        # Every key of a session is on the node that owns it, and only there
+        assert len(_session_keys(owner, "t", session)) == 3
+        for client in store.ring.nodes.values():
+            if client is not owner:
+                assert not _session_keys(client, "t", session)
+        assert [c.question for c in store.recent("t", session)] == ["q0"]
+    assert len(used) > 1
+
+
+def test_max_conversations_trims_the_oldest():
+    store = _store(max_conversations=3, codec=BinaryCodec())
+    client = store.client_for("t", "s")
+    for i in range(4):
+        pair = [_conversation(2 * i, f"c{i}"), _conversation(2 * i + 1, f"c{i}")]
+        store.append("t", "s", pair, f"c{i}")
+
+    assert [c.question for c in store.recent("t", "s")] == ["q7", "q6", "q5"]
+    assert [c.pre_context for c in store.recent("t", "s")] == ["c3", "c3", "c2"]
+    assert client.zrange(recency_key("t", "s"), 0, -1) == [b"6", b"7", b"8"]
+    # The pre_contexts live with the conversations, so none are left behind
+    assert _session_keys(client, "t", "s") == {
+        conversation_key("t", "s", 6),
+        conversation_key("t", "s", 7),
+        conversation_key("t", "s", 8),
+        recency_key("t", "s"),
+        sequence_key("t", "s"),
+    }
+
+
+def test_ttl_is_refreshed_on_every_key_of_the_session():
+    now = [1000.0]
+    store = _store(ttl=60, clock=lambda: now[0])
+    client = store.client_for("t", "s")
+    store.append("t", "s", [_conversation(0)])
+    client.expiry.clear()
+    store.append("t", "s", [_conversation(1)])
+
+    for name in _session_keys(client, "t", "s"):
+        assert client.ttl(name) == 60
+
+
+def test_ttl_drops_idle_sessions_from_the_index():
+    now = [1000.0]
+    store = _store(ttl=60, clock=lambda: now[0])
+    client = store.client_for("t", "idle")
+    store.append("t", "idle", [_conversation(0)])
+    now[0] += 61
+    store.append("t", "active", [_conversation(1)])
+    assert client.zrange(SESSIONS_KEY, 0, -1) == [b"t:active"]
+
+
+def test_delete_session_removes_every_key():
+    store = _store(codec=BinaryCodec())
+    client = store.client_for("t", "s")
+    store.append("t", "s", [_conversation(0, "context")], "context")
+    store.append("t", "s", [_conversation(1, "context")], "context")
+    store.delete_session("t", "s")
+    assert not _session_keys(client, "t", "s")
+    assert client.zrange(SESSIONS_KEY, 0, -1) == []
+
+
+def test_add_node_moves_the_sessions_it_owns():
+    store = _store(codec=BinaryCodec())
+    source = store.ring.nodes["node0"]
+    sessions = [f"s{i}" for i in range(30)]
+    for session in sessions:
+        store.append("t", session, [_conversation(0, "c"), _conversation(1, "c")], "c")
+        store.append("t", session, [_conversation(2, "d")], "d")
+
+    target = FakeRedis()
+    moved = store.add_node("node1", target)
+    owned = [s for s in sessions if store.node_for("t", s) == "node1"]
+    assert moved == len(owned) > 0
+
+    reader = SessionStore(store.ring, codec=BinaryCodec())  # Nothing cached
+    for session in sessions:
+        recent = reader.recent("t", session)
+        assert [c.question for c in recent] == ["q2", "q1", "q0"]
+        assert [c.pre_context for c in recent] == ["d", "c", "c"]
+    for session in owned:
+        assert not _session_keys(source, "t", session)
+        assert store.append("t", session, [_conversation(3)]) == [4]
+    assert sorted(m.decode() for m in target.zrange(SESSIONS_KEY, 0, -1)) == sorted(
+        f"t:{s}" for s in owned
+    )
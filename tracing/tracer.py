@@ -0,0 +1,330 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+# Upper bounds in milliseconds of the latency histogram buckets
+DEFAULT_BUCKETS_MS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000
+)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("span", default=None)
+_ids = itertools.count(1)
+
+
+class Span:
+    """
+    One timed operation, nested under the span that was current when it began
+    """
+
+    __slots__ = (
+        "tracer", "name", "attributes", "span_id", "parent_id", "trace_id",
+        "start_ns", "end_ns", "error", "_token",
+    )
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_ids)
+        self.parent_id = None
+        self.trace_id = self.span_id
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error = None
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        parent = _current_span.get()
+        if parent is not None:
+            self.parent_id = parent.span_id
+            self.trace_id = parent.trace_id
+        self._token = _current_span.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.perf_counter_ns()
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = repr(exc)
+        self.tracer._finish(self)
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "trace_id": self.trace_id,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class _NoopSpan:
+    """
+    Shared stand-in returned while tracing is disabled
+    """
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last bucket is overflow
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bucket bound below which q (0-1) of observations fall
+        :param q:
+        :return:
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "min_ms": self.min if self.count else 0.0,
+            "max_ms": self.max,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+        }
+
+
+class Exporter(ABC):
+    """
+    Receives batches of finished spans
+    """
+
+    @abstractmethod
+    def export(self, spans: List[Span]):
+        ...
+
+    def shutdown(self):
+        pass
+
+
+class InMemoryExporter(Exporter):
+    """
+    Keeps the most recent finished spans, for tests and debugging
+    """
+
+    def __init__(self, max_spans: int = 10000):
+        self.spans: deque = deque(maxlen=max_spans)
+
+    def export(self, spans: List[Span]):
+        self.spans.extend(spans)
+
+
+class JsonExporter(Exporter):
+    """
+    Appends finished spans to a file as JSON lines
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with self._lock, open(self.path, "a") as f:
+            f.write(lines)
+
+
+class Tracer:
+    """
+    Tracer class for nested spans, latency histograms and counters
+
+    While disabled, span() returns a shared no-op span and count() returns at
+    once, so instrumented code pays for little more than the call.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        exporter: Optional[Exporter] = None,
+        batch_size: int = 100,
+    ):
+        """
+        :param enabled:
+        :param exporter: where finished spans go, an InMemoryExporter by default
+        :param batch_size: finished spans buffered before they are exported
+        """
+        self.enabled = enabled
+        self.exporter = exporter or InMemoryExporter()
+        self.batch_size = batch_size
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self._pending: List[Span] = []
+        self._lock = threading.Lock()
+
+    def configure(
+        self,
+        enabled: bool = True,
+        exporter: Optional[Exporter] = None,
+        batch_size: Optional[int] = None,
+    ):
+        """
+        Enable or disable tracing
+        :param enabled:
+        :param exporter: replaces the current exporter when given
+        :param batch_size:
+        :return:
+        """
+        self.flush()
+        self.enabled = enabled
+        if exporter is not None:
+            self.exporter = exporter
+        if batch_size is not None:
+            self.batch_size = batch_size
+
+    def span(self, name: str, **attributes):
+        """
+        Time a block: with tracer.span("redis.fetch", key=key): ...
+        :param name:
+        :param attributes:
+        :return:
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def count(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def traced(self, name: Optional[str] = None):
+        """
+        Decorator timing every call of a function or coroutine function
+        :param name: span name, defaults to the function's qualified name
+        :return:
+        """
+
+        def decorate(function: Callable):
+            span_name = name or function.__qualname__
+            if inspect.iscoroutinefunction(function):
+
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await function(*args, **kwargs)
+                    with Span(self, span_name, {}):
+                        return await function(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Span(self, span_name, {}):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorate
+
+    def _finish(self, span: Span):
+        with self._lock:
+            histogram = self.histograms.get(span.name)
+            if histogram is None:
+                histogram = self.histograms[span.name] = Histogram()
+            histogram.observe(span.duration_ms)
+            if span.error is not None:
+                self.counters[f"{span.name}.errors"] = (
+                    self.counters.get(f"{span.name}.errors", 0) + 1
+                )
+            if self.exporter is None:
+                return
+            self._pending.append(span)
+            if len(self._pending) < self.batch_size:
+                return
+            batch, self._pending = self._pending, []
+        self.exporter.export(batch)
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch and self.exporter is not None:
+            self.exporter.export(batch)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Current counters and latency summaries
+        :return:
+        """
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "latency": {
+                    name: histogram.summary()
+                    for name, histogram in self.histograms.items()
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self._pending.clear()
+
+
+# Process-wide tracer the package is instrumented with; disabled until
+# tracer.configure() is called
+tracer = Tracer()